@@ -10,8 +10,115 @@ class Settings(BaseSettings):
     GROQ_TTS_MODEL: str = "playai-tts"
     OPENAI_API_KEY: str = ""
     OPENAI_TRANSCRIBE_MODEL: str = "whisper-1"
+    GROQ_BASE_URL: str = "https://api.groq.com/openai/v1"
+    # Shared upstream HTTP client (connection pool + per-endpoint timeouts, seconds)
+    UPSTREAM_HTTP2: bool = True
+    UPSTREAM_MAX_CONNECTIONS: int = 50
+    UPSTREAM_MAX_KEEPALIVE: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_TIMEOUT_DEFAULT: float = 30.0
+    UPSTREAM_TIMEOUT_METADATA: float = 20.0
+    UPSTREAM_TIMEOUT_SEARCH: float = 30.0
+    UPSTREAM_TIMEOUT_COMMENT: float = 12.0
+    UPSTREAM_TIMEOUT_TRANSCRIPTION: float = 60.0
+    UPSTREAM_TIMEOUT_TTS: float = 60.0
+    # Retries on 429/5xx (within each call's deadline) and the circuit breaker
+    # that fails calls fast after UPSTREAM_BREAKER_FAILURES failed calls in a row
+    UPSTREAM_RETRIES: int = 2
+    UPSTREAM_BACKOFF_BASE: float = 0.25
+    UPSTREAM_BACKOFF_MAX: float = 2.0
+    UPSTREAM_BREAKER_FAILURES: int = 5
+    UPSTREAM_BREAKER_COOLDOWN: float = 30.0
+    # Concurrent Groq calls allowed per endpoint
+    UPSTREAM_CONCURRENCY_DEFAULT: int = 16
+    UPSTREAM_CONCURRENCY_METADATA: int = 8
+    UPSTREAM_CONCURRENCY_SEARCH: int = 16
+    UPSTREAM_CONCURRENCY_COMMENT: int = 16
+    UPSTREAM_CONCURRENCY_TRANSCRIPTION: int = 8
+    UPSTREAM_CONCURRENCY_TTS: int = 16
+    # Background metadata enrichment
+    ENRICH_WORKERS: int = 4
+    ENRICH_QUEUE_SIZE: int = 1000
+    ENRICH_MAX_ATTEMPTS: int = 3
+    ENRICH_RETRY_DELAY: float = 30.0
+    ENRICH_SWEEP_INTERVAL: float = 5.0
+    ENRICH_PACK_SIZE: int = 8
+    ENRICH_PACK_MAX_CHARS: int = 600
+    BATCH_MAX_ITEMS: int = 1000
+    # Clearing an account: inline up to PURGE_INLINE_MAX thoughts, otherwise a
+    # background job deletes PURGE_CHUNK_SIZE rows per transaction
+    PURGE_INLINE_MAX: int = 5000
+    PURGE_CHUNK_SIZE: int = 1000
+    # Disk cache for synthesized speech
+    TTS_CACHE_DIR: str = str(Path(__file__).resolve().parent.parent / "tts_cache")
+    TTS_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    TTS_CACHE_MAX_AGE: int = 86400
+    TTS_STREAM_PREFETCH: int = 2
+    TTS_STREAM_CHUNK_BYTES: int = 16384
+    # Uploads and long-recording transcription
+    UPLOAD_MAX_BYTES: int = 100 * 1024 * 1024
+    TRANSCRIBE_SEGMENT_SECONDS: float = 120.0
+    TRANSCRIBE_OVERLAP_SECONDS: float = 2.0
+    TRANSCRIBE_SILENCE_SEARCH_SECONDS: float = 15.0
+    TRANSCRIBE_PARALLELISM: int = 4
+    # Search result cache ("memory" per process, or "sqlite" shared by workers;
+    # empty picks "sqlite" when WEB_CONCURRENCY > 1 and "memory" otherwise)
+    QUERY_CACHE_ENABLED: bool = True
+    QUERY_CACHE_BACKEND: str = ""
+    QUERY_CACHE_PATH: str = str(Path(__file__).resolve().parent.parent / "query_cache.db")
+    QUERY_CACHE_MAX_ENTRIES: int = 2048
+    QUERY_CACHE_TTL: float = 300.0
+    # FTS ranking: bm25 weight per column, boost per query term that is one of
+    # the thought's tags, and how much recency counts (0 = not at all)
+    SEARCH_WEIGHT_TITLE: float = 3.0
+    SEARCH_WEIGHT_CONTENT: float = 1.0
+    SEARCH_WEIGHT_TAGS: float = 2.0
+    SEARCH_TAG_BOOST: float = 0.5
+    SEARCH_RECENCY_WEIGHT: float = 0.3
+    SEARCH_RECENCY_HALF_LIFE_DAYS: float = 30.0
+    # Response compression: gzip, or brotli when the package is installed
+    COMPRESS_ENABLED: bool = True
+    COMPRESS_MIN_BYTES: int = 1024
+    COMPRESS_MEDIA_TYPES: str = "application/json,text/plain,audio/wav"
+    COMPRESS_GZIP_LEVEL: int = 6
+    COMPRESS_BROTLI_QUALITY: int = 4
+    # Persistent memo of LLM metadata by content hash (table in DATABASE_URL)
+    METADATA_CACHE_ENABLED: bool = True
+    METADATA_CACHE_MAX_ENTRIES: int = 50000
     DATABASE_URL: str = "sqlite:///./local.db"
+    # Async driver URL; derived from DATABASE_URL (sqlite -> sqlite+aiosqlite) when empty
+    ASYNC_DATABASE_URL: str = ""
+    # SQLite connection profile (applied on every new connection)
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64000
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    SQLITE_READ_POOL_SIZE: int = 8
+    SQLITE_WRITE_POOL_TIMEOUT: float = 30.0
     ALLOW_ORIGINS: str = "http://localhost:8081"
+    # Worker processes serving the app; uvicorn and gunicorn read the same
+    # variable as their default worker count
+    WEB_CONCURRENCY: int = 1
+    # Insert the "demo" user's sample thoughts on startup (idempotent)
+    SEED_DEMO_DATA: bool = False
+    # Local vector index used alongside FTS to pre-select candidates for assist-search-full
+    VECTOR_INDEX_DIR: str = str(Path(__file__).resolve().parent.parent / "vector_index")
+    VECTOR_EMBEDDER: str = "hashing"
+    VECTOR_DIM: int = 512
+    VECTOR_CANDIDATES: int = 40
+    VECTOR_INDEX_MAX_LOADED: int = 256
+    # Cosine a vector-only match needs to be returned when the rerank is
+    # unavailable (unrelated text scores about 0 with the hashing embedder)
+    VECTOR_MIN_SCORE: float = 0.1
+    # assist-search-full: candidates kept after local ranking, and the prompt
+    # budget (approximate tokens) and timeout for the Groq rerank
+    ASSIST_CANDIDATES: int = 30
+    ASSIST_RERANK_TOKEN_BUDGET: int = 1500
+    ASSIST_SNIPPET_CHARS: int = 200
+    ASSIST_RERANK_TIMEOUT: float = 6.0
     # Pydantic v2 settings config: read from .env and ignore extra keys (e.g., vapi_api_key)
     model_config = SettingsConfigDict(
         env_file=str(Path(__file__).resolve().parent.parent / ".env"),
@@ -1,19 +1,143 @@
-import json
+import time
 import uuid
 from datetime import datetime
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
-from sqlalchemy import Column, DateTime, String, Text, create_engine
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.config import settings
+from app.services import metrics
 
 _is_sqlite = settings.DATABASE_URL.startswith("sqlite")
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if _is_sqlite else {},
-)
+_sqlite_file = make_url(settings.DATABASE_URL).database if _is_sqlite else None
+_is_sqlite_file = bool(_sqlite_file) and _sqlite_file != ":memory:" and not _sqlite_file.startswith("file:")
+
+
+def _sqlite_pragmas(read_only: bool) -> list:
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA cache_size = {int(settings.SQLITE_CACHE_SIZE)}",
+        f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}",
+        f"PRAGMA temp_store = {settings.SQLITE_TEMP_STORE}",
+    ]
+    if not read_only:
+        # journal_mode is persistent in the file; only the writer sets it.
+        pragmas.insert(0, f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+        pragmas.insert(1, f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+    return pragmas
+
+
+def _apply_pragmas(target, read_only: bool) -> None:
+    @event.listens_for(target, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            for pragma in _sqlite_pragmas(read_only):
+                cur.execute(pragma)
+        finally:
+            cur.close()
+
+
+def _instrument(target, name: str) -> None:
+    """Feed statement timings into metrics.db_query_duration."""
+
+    @event.listens_for(target, "before_cursor_execute")
+    def _before(conn, _cursor, _statement, _params, _context, _executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(target, "after_cursor_execute")
+    def _after(conn, _cursor, statement, _params, _context, _executemany):
+        started = conn.info["query_started"].pop()
+        op = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+        if op not in ("select", "insert", "update", "delete"):
+            op = "other"
+        metrics.db_query_duration.observe(time.perf_counter() - started, engine=name, op=op)
+
+    @event.listens_for(target, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+if _is_sqlite_file:
+    # Each writer engine has a single pooled connection, so writes are
+    # serialized in the app instead of contending for SQLite's write lock;
+    # reads use a separate pool of read-only connections that WAL lets run
+    # alongside it.
+    engine = create_engine(
+        settings.DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.SQLITE_WRITE_POOL_TIMEOUT,
+    )
+    read_engine = create_engine(
+        f"sqlite:///file:{_sqlite_file}?mode=ro&uri=true",
+        connect_args={"check_same_thread": False},
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        max_overflow=settings.SQLITE_READ_POOL_SIZE,
+    )
+    _apply_pragmas(engine, read_only=False)
+    _apply_pragmas(read_engine, read_only=True)
+else:
+    engine = create_engine(
+        settings.DATABASE_URL,
+        connect_args={"check_same_thread": False} if _is_sqlite else {},
+    )
+    read_engine = engine
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+def _async_url() -> str:
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(settings.DATABASE_URL)
+    if _is_sqlite:
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.render_as_string(hide_password=False)
+
+
+# Async twins of the engines above, used by the routers and background
+# workers so DB I/O runs on the event loop instead of Starlette's thread
+# pool. That makes two writer pools per process: async_engine takes every
+# write made while serving, and the sync `engine` only those made before
+# the app accepts requests (init_db, demo seeding) or outside it (scripts
+# such as bench.seed, rebuild_thought_fts). They do not overlap in a running
+# server; when they do meet (a script against a live database, workers
+# migrating at once) the later writer waits out SQLITE_BUSY_TIMEOUT_MS.
+if _is_sqlite_file:
+    async_engine = create_async_engine(
+        _async_url(),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.SQLITE_WRITE_POOL_TIMEOUT,
+    )
+    async_read_engine = create_async_engine(
+        f"sqlite+aiosqlite:///file:{_sqlite_file}?mode=ro&uri=true",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        max_overflow=settings.SQLITE_READ_POOL_SIZE,
+    )
+    _apply_pragmas(async_engine.sync_engine, read_only=False)
+    _apply_pragmas(async_read_engine.sync_engine, read_only=True)
+else:
+    async_engine = create_async_engine(_async_url())
+    async_read_engine = async_engine
+_instrument(async_engine.sync_engine, "write")
+if async_read_engine is not async_engine:
+    _instrument(async_read_engine.sync_engine, "read")
+_instrument(engine, "sync")
+if read_engine is not engine:
+    _instrument(read_engine, "sync_read")
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -29,50 +153,181 @@ class Thought(Base):
     tags_json = Column(Text, nullable=True)
     entities_json = Column(Text, nullable=True)
     interpretation = Column(Text, nullable=True)
+    # pending -> done | failed, driven by the background enrichment workers
+    enrichment_status = Column(String, default="done", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
+    __table_args__ = (
+        # Keyset pagination: newest-first per user with id as the tiebreaker
+        Index("ix_thoughts_user_created_id", "user_id", "created_at", "id"),
+    )
 
-def init_db() -> None:
-    Base.metadata.create_all(bind=engine)
-    with engine.begin() as conn:
-        conn.exec_driver_sql(
-            """
-            CREATE VIRTUAL TABLE IF NOT EXISTS thoughts_fts
-            USING fts5(
-                title,
-                content,
-                tags_text,
-                thought_id UNINDEXED
-            )
-            """
-        )
-    if _is_sqlite:
-        with engine.begin() as conn:
-            rows = conn.exec_driver_sql("PRAGMA table_info('thoughts')").fetchall()
-            cols = {r[1] for r in rows}
-            if "interpretation" not in cols:
-                conn.exec_driver_sql("ALTER TABLE thoughts ADD COLUMN interpretation TEXT")
 
+class EnrichmentJob(Base):
+    __tablename__ = "enrichment_jobs"
 
-def upsert_thought_fts(thought: Thought) -> None:
-    tags = []
-    if thought.tags_json:
-        try:
-            tags = json.loads(thought.tags_json) or []
-        except Exception:
-            tags = []
-    tags_text = " ".join(tags)
-    with engine.begin() as conn:
-        conn.exec_driver_sql("DELETE FROM thoughts_fts WHERE thought_id = ?", (thought.id,))
-        conn.exec_driver_sql(
-            "INSERT INTO thoughts_fts (title, content, tags_text, thought_id) VALUES (?, ?, ?, ?)",
-            (thought.title or "", thought.content, tags_text, thought.id),
-        )
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    thought_id = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False, index=True)
+    provided_title = Column(String, nullable=True)
+    status = Column(String, default="pending", nullable=False, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class PurgeJob(Base):
+    __tablename__ = "purge_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, nullable=False, index=True)
+    status = Column(String, default="running", nullable=False, index=True)
+    # Only thoughts created up to this point are purged; newer ones are kept.
+    cutoff = Column(DateTime, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+    deleted = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class MetadataCacheEntry(Base):
+    """Memoized extract_metadata results, keyed by services.metadata_cache.key_for."""
+
+    __tablename__ = "metadata_cache"
+
+    key = Column(String, primary_key=True)
+    value_json = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_used = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
 
-def delete_thought_fts(thought_id: str) -> None:
+class ThoughtTag(Base):
+    __tablename__ = "thought_tags"
+
+    thought_id = Column(String, primary_key=True)
+    tag = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False)
+
+    __table_args__ = (Index("ix_thought_tags_user_tag", "user_id", "tag", "thought_id"),)
+
+
+class ThoughtEntity(Base):
+    __tablename__ = "thought_entities"
+
+    thought_id = Column(String, primary_key=True)
+    entity = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False)
+
+    __table_args__ = (Index("ix_thought_entities_user_entity", "user_id", "entity", "thought_id"),)
+
+
+# Full-text index over `thoughts`. It is an external-content FTS5 table, so
+# it stores only the inverted index (row text is read back from `thoughts`
+# by rowid) and is kept in sync by triggers that run inside the same
+# transaction as the row write. `user_id` is indexed as well so per-user
+# queries are narrowed inside MATCH instead of by a join.
+#
+# The rowid link relies on `thoughts` keeping its implicit rowids; VACUUM may
+# renumber them, so call rebuild_thought_fts() after a VACUUM.
+_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS thoughts_fts
+    USING fts5(
+        title,
+        content,
+        tags_json,
+        user_id,
+        content='thoughts',
+        content_rowid='rowid'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS thoughts_fts_ai AFTER INSERT ON thoughts BEGIN
+        INSERT INTO thoughts_fts (rowid, title, content, tags_json, user_id)
+        VALUES (new.rowid, new.title, new.content, new.tags_json, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS thoughts_fts_ad AFTER DELETE ON thoughts BEGIN
+        INSERT INTO thoughts_fts (thoughts_fts, rowid, title, content, tags_json, user_id)
+        VALUES ('delete', old.rowid, old.title, old.content, old.tags_json, old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS thoughts_fts_au AFTER UPDATE OF title, content, tags_json, user_id ON thoughts BEGIN
+        INSERT INTO thoughts_fts (thoughts_fts, rowid, title, content, tags_json, user_id)
+        VALUES ('delete', old.rowid, old.title, old.content, old.tags_json, old.user_id);
+        INSERT INTO thoughts_fts (rowid, title, content, tags_json, user_id)
+        VALUES (new.rowid, new.title, new.content, new.tags_json, new.user_id);
+    END
+    """,
+]
+
+
+def _facet_insert(table: str, column: str, row: str, json_col: str, source: str = "") -> str:
+    # Strings from the JSON array, trimmed and lower-cased; malformed or
+    # non-array JSON contributes nothing rather than failing the write.
+    src = f"{row}.{json_col}"
+    return f"""
+        INSERT OR IGNORE INTO {table} (thought_id, user_id, {column})
+        SELECT {row}.id, {row}.user_id, lower(trim(j.value))
+        FROM {source}json_each(CASE WHEN json_valid({src}) THEN CASE WHEN json_type({src}) = 'array' THEN {src} END END) AS j
+        WHERE j.type = 'text' AND trim(j.value) <> ''"""
+
+
+# `thought_tags` / `thought_entities` mirror the JSON columns so tags and
+# entities can be filtered and counted through the (user_id, value) indexes.
+# Like the FTS index they are maintained by triggers, so every write path
+# (ingest, enrichment, deletes) keeps them in step within its transaction.
+_FACET_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS thought_facets_ai AFTER INSERT ON thoughts BEGIN
+        {_facet_insert("thought_tags", "tag", "new", "tags_json")};
+        {_facet_insert("thought_entities", "entity", "new", "entities_json")};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS thought_facets_ad AFTER DELETE ON thoughts BEGIN
+        DELETE FROM thought_tags WHERE thought_id = old.id;
+        DELETE FROM thought_entities WHERE thought_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS thought_facets_au AFTER UPDATE OF tags_json, entities_json, user_id ON thoughts BEGIN
+        DELETE FROM thought_tags WHERE thought_id = old.id;
+        DELETE FROM thought_entities WHERE thought_id = old.id;
+        {_facet_insert("thought_tags", "tag", "new", "tags_json")};
+        {_facet_insert("thought_entities", "entity", "new", "entities_json")};
+    END
+    """,
+]
+
+_FACET_BACKFILL = [
+    _facet_insert("thought_tags", "tag", "t", "tags_json", source="thoughts AS t, "),
+    _facet_insert("thought_entities", "entity", "t", "entities_json", source="thoughts AS t, "),
+]
+
+
+def rebuild_thought_fts() -> None:
     with engine.begin() as conn:
-        conn.exec_driver_sql("DELETE FROM thoughts_fts WHERE thought_id = ?", (thought_id,))
+        conn.exec_driver_sql("INSERT INTO thoughts_fts (thoughts_fts) VALUES ('rebuild')")
+
+
+def fts_user_query(user_id: str, query: str) -> str:
+    """Scope an FTS5 query to one user's rows via the indexed user_id column.
+
+    The query itself is restricted to the text columns, so its terms never
+    match an owner id. The phrase match on user_id can also hit ids that
+    merely contain the same tokens (e.g. "demo" vs "demo-2"), so callers
+    still compare user_id exactly.
+    """
+    scoped = f"{{title content tags_json}} : ({query})"
+    if not any(ch.isalnum() for ch in user_id):
+        return scoped
+    quoted = '"' + user_id.replace('"', '""') + '"'
+    return f"user_id : {quoted} AND {scoped}"
 
 
 def get_db() -> Generator:
@@ -81,3 +336,27 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+def get_read_db() -> Generator:
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+async def dispose_engines() -> None:
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
@@ -1,9 +1,29 @@
 import json
-from fastapi import FastAPI
+import uuid
+from datetime import datetime
+
+from anyio import to_thread
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from app.config import settings
-from app.db import init_db, Thought, SessionLocal, upsert_thought_fts
+from app.db import async_engine, async_read_engine, dispose_engines, engine, Thought
+from app.migrations import init_db
+from app.services import (
+    compression,
+    enrichment,
+    metadata_cache,
+    metrics,
+    purge,
+    query_cache,
+    resilience,
+    singleflight,
+    upload_limit,
+    upstream,
+    vector_index,
+)
+from app.services.tts_cache import cache as tts_cache
 from app.routers.thoughts import router as thoughts_router
 from app.routers.search import router as search_router
 from app.routers.vapi_tools import router as vapi_tools_router
@@ -11,6 +31,9 @@ from app.routers.audio import router as audio_router
 
 app = FastAPI(title="Backend", version="1.0.0")
 
+# Added before CORS so it runs inside it and its 413s carry CORS headers.
+app.add_middleware(upload_limit.UploadLimitMiddleware)
+
 origins = [o.strip() for o in settings.ALLOW_ORIGINS.split(",") if o.strip()]
 app.add_middleware(
     CORSMiddleware,
@@ -20,46 +43,154 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 app.include_router(thoughts_router, prefix="/v1")
 app.include_router(search_router, prefix="/v1")
 app.include_router(vapi_tools_router, prefix="/v1")
 app.include_router(audio_router, prefix="/v1")
 
 
+_DEMO_USER = "demo"
+_DEMO_NAMESPACE = uuid.UUID("6f1d3c52-8b0e-4a57-9e1c-2d7f4b9a0c31")
+_DEMO_SAMPLES = [
+    {"title": "Fishing startup note", "content": "Comment about the fishing startup last week.", "tags": ["fishing", "startup"]},
+    {"title": "Pitch deck reminder", "content": "Reminder: prepare the pitch deck for the fintech demo on Tuesday.", "tags": ["reminder", "fintech", "pitch"]},
+    {"title": "Hiring meeting notes", "content": "Meeting notes: talked to Sarah about hiring a full-stack engineer.", "tags": ["hiring", "meeting"]},
+    {"title": "Creator CRM idea", "content": "Idea: lightweight CRM for solo creators with AI summaries.", "tags": ["idea", "crm", "ai"]},
+    {"title": "Workout log", "content": "Workout log: 5k run in 26 minutes at the park.", "tags": ["fitness", "running"]},
+    {"title": "Mic research", "content": "Research: best microphones for iOS recording in noisy rooms.", "tags": ["research", "audio", "ios"]},
+]
+
+
+def seed_demo_data() -> None:
+    """Insert the demo user's sample thoughts unless they already exist.
+
+    Ids are derived from the sample position, so reruns (and workers booting
+    side by side) hit the primary key and insert nothing."""
+    rows = [
+        {
+            "id": str(uuid.uuid5(_DEMO_NAMESPACE, str(i))),
+            "user_id": _DEMO_USER,
+            "source": "manual",
+            "title": s.get("title"),
+            "summary": None,
+            "content": s.get("content", ""),
+            "tags_json": json.dumps(s.get("tags", []), ensure_ascii=False),
+            "entities_json": json.dumps(s.get("entities", []), ensure_ascii=False),
+            "interpretation": None,
+            "enrichment_status": "done",
+            "created_at": datetime.utcnow(),
+        }
+        for i, s in enumerate(_DEMO_SAMPLES)
+    ]
+    stmt = sqlite_insert(Thought.__table__).values(rows).on_conflict_do_nothing().returning(Thought.id)
+    with engine.begin() as conn:
+        inserted = set(conn.execute(stmt).scalars())
+    if not inserted:
+        return
+    # Cached searches and ETags can outlive the process (sqlite backend).
+    query_cache.backend().bump(_DEMO_USER)
+    index = vector_index.index_for(_DEMO_USER)
+    if index.exists:
+        index.add(
+            [
+                (r["id"], vector_index.thought_text(r["title"], r["content"], json.loads(r["tags_json"])))
+                for r in rows
+                if r["id"] in inserted
+            ]
+        )
+
+
 @app.on_event("startup")
 def on_startup():
     init_db()
-    db = SessionLocal()
-    try:
-        user_id = "demo"
-        samples = [
-            {"title": "Fishing startup note", "content": "Comment about the fishing startup last week.", "tags": ["fishing", "startup"]},
-            {"title": "Pitch deck reminder", "content": "Reminder: prepare the pitch deck for the fintech demo on Tuesday.", "tags": ["reminder", "fintech", "pitch"]},
-            {"title": "Hiring meeting notes", "content": "Meeting notes: talked to Sarah about hiring a full-stack engineer.", "tags": ["hiring", "meeting"]},
-            {"title": "Creator CRM idea", "content": "Idea: lightweight CRM for solo creators with AI summaries.", "tags": ["idea", "crm", "ai"]},
-            {"title": "Workout log", "content": "Workout log: 5k run in 26 minutes at the park.", "tags": ["fitness", "running"]},
-            {"title": "Mic research", "content": "Research: best microphones for iOS recording in noisy rooms.", "tags": ["research", "audio", "ios"]},
-        ]
-        for s in samples:
-            t = Thought(
-                user_id=user_id,
-                source="manual",
-                title=s.get("title"),
-                summary=None,
-                content=s.get("content", ""),
-                tags_json=json.dumps(s.get("tags", []), ensure_ascii=False),
-                entities_json=json.dumps(s.get("entities", []), ensure_ascii=False),
-                interpretation=None,
-            )
-            db.add(t)
-        db.commit()
-        rows = db.query(Thought).filter(Thought.user_id == user_id).all()
-        for r in rows:
-            upsert_thought_fts(r)
-    finally:
-        db.close()
+    # Created now so a backend that cannot serve several workers fails the boot.
+    query_cache.backend()
+    if settings.SEED_DEMO_DATA:
+        seed_demo_data()
+
+
+@app.on_event("startup")
+async def open_upstream():
+    await upstream.startup()
+
+
+@app.on_event("startup")
+async def start_enrichment():
+    await enrichment.start()
+
+
+@app.on_event("startup")
+async def resume_purges():
+    await purge.start()
+
+
+@app.on_event("shutdown")
+async def stop_enrichment():
+    await enrichment.stop()
+
+
+@app.on_event("shutdown")
+async def stop_purges():
+    await purge.stop()
+
+
+@app.on_event("shutdown")
+async def close_upstream():
+    await upstream.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_db():
+    await dispose_engines()
 
 
 @app.get("/health")
-def health():
+async def health():
     return {"ok": True}
+
+
+def _runtime_metrics():
+    caches = {
+        "query": (query_cache.hits, query_cache.misses),
+        "tts": (tts_cache.hits, tts_cache.misses),
+        "metadata": (metadata_cache.hits, metadata_cache.misses),
+    }
+    yield "cache_hits_total", "counter", "Cache hits by cache.", [({"cache": k}, h) for k, (h, _) in caches.items()]
+    yield "cache_misses_total", "counter", "Cache misses by cache.", [({"cache": k}, m) for k, (_, m) in caches.items()]
+    yield "cache_hit_ratio", "gauge", "Hits over lookups since start, by cache.", [
+        ({"cache": k}, h / (h + m) if h + m else 0.0) for k, (h, m) in caches.items()
+    ]
+    flights = singleflight.stats()
+    yield "upstream_coalesced_total", "counter", "Upstream calls served by an identical in-flight call.", [
+        ({"service": k}, v["collapsed"]) for k, v in flights.items()
+    ]
+    breakers = resilience.stats()
+    yield "upstream_circuit_open", "gauge", "1 while the service's circuit breaker rejects calls.", [
+        ({"service": k}, 1 if v["state"] == "open" else 0) for k, v in breakers.items()
+    ]
+    yield "upstream_inflight", "gauge", "Groq calls holding a concurrency slot, by service.", [
+        ({"service": k}, v["inflight"]) for k, v in breakers.items()
+    ]
+    limiter = to_thread.current_default_thread_limiter()
+    yield "threadpool_busy_threads", "gauge", "Worker threads in use by the default anyio pool.", [
+        ({}, limiter.borrowed_tokens)
+    ]
+    yield "threadpool_max_threads", "gauge", "Size of the default anyio thread pool.", [({}, limiter.total_tokens)]
+    pools = {"write": async_engine.sync_engine.pool, "read": async_read_engine.sync_engine.pool}
+    yield "db_pool_checked_out", "gauge", "Connections currently checked out, by engine.", [
+        ({"engine": k}, p.checkedout()) for k, p in pools.items() if hasattr(p, "checkedout")
+    ]
+    queue = enrichment.queue_stats()
+    yield "enrichment_queue_depth", "gauge", "Enrichment jobs waiting in the in-memory queue.", [({}, queue["depth"])]
+    yield "enrichment_inflight", "gauge", "Enrichment jobs queued or being processed.", [({}, queue["inflight"])]
+
+
+metrics.register_collector(_runtime_metrics)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
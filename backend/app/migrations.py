@@ -0,0 +1,116 @@
+import time
+from typing import Callable, List, Tuple
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+from app.db import _FACET_BACKFILL, _FACET_DDL, _FTS_DDL, Base, _is_sqlite, engine
+
+# Versioned schema migrations. `schema_version` records the last migration
+# applied; on boot only that one row is read unless something is pending,
+# so startup cost does not grow with the database. Pending migrations run
+# in order inside a single BEGIN IMMEDIATE transaction: when several
+# workers start together, one takes the write lock and migrates while the
+# others wait, then find the version current and skip.
+#
+# Databases created before this table existed start at version 0, so every
+# migration must cope with its change already being (partly) present.
+# Append new migrations to the end; never reorder or edit applied ones.
+
+_LOCK_WAIT_SECONDS = 300.0
+
+
+def _create_tables(conn: Connection) -> None:
+    Base.metadata.create_all(bind=conn)
+    # create_all skips existing tables, so add any of their missing indexes.
+    for table in Base.metadata.sorted_tables:
+        for idx in table.indexes:
+            idx.create(conn, checkfirst=True)
+
+
+def _thought_columns(conn: Connection) -> None:
+    if not _is_sqlite:
+        return
+    cols = {r[1] for r in conn.exec_driver_sql("PRAGMA table_info('thoughts')").fetchall()}
+    if "interpretation" not in cols:
+        conn.exec_driver_sql("ALTER TABLE thoughts ADD COLUMN interpretation TEXT")
+    if "enrichment_status" not in cols:
+        conn.exec_driver_sql("ALTER TABLE thoughts ADD COLUMN enrichment_status VARCHAR NOT NULL DEFAULT 'done'")
+
+
+def _external_content_fts(conn: Connection) -> None:
+    existing = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'thoughts_fts'"
+    ).scalar()
+    # Older databases carry a standalone FTS copy keyed by thought_id.
+    rebuild = existing is None or "content='thoughts'" not in existing
+    if existing is not None and rebuild:
+        conn.exec_driver_sql("DROP TABLE thoughts_fts")
+    for ddl in _FTS_DDL:
+        conn.exec_driver_sql(ddl)
+    if rebuild:
+        conn.exec_driver_sql("INSERT INTO thoughts_fts (thoughts_fts) VALUES ('rebuild')")
+
+
+def _facet_tables(conn: Connection) -> None:
+    for ddl in _FACET_DDL:
+        conn.exec_driver_sql(ddl)
+    # Index the rows written before the tables existed; INSERT OR IGNORE
+    # makes this safe on databases that already had the triggers.
+    for sql in _FACET_BACKFILL:
+        conn.exec_driver_sql(sql)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "create tables", _create_tables),
+    (2, "thought interpretation and enrichment_status columns", _thought_columns),
+    (3, "external-content FTS index", _external_content_fts),
+    (4, "tag and entity tables", _facet_tables),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def _current_version(conn: Connection) -> int:
+    try:
+        return conn.exec_driver_sql("SELECT MAX(version) FROM schema_version").scalar() or 0
+    except OperationalError:
+        return 0
+
+
+def _begin_immediate(conn: Connection) -> None:
+    deadline = time.monotonic() + _LOCK_WAIT_SECONDS
+    while True:
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def init_db() -> None:
+    """Bring the schema up to date; a no-op beyond one query when it already is."""
+    with engine.connect() as conn:
+        if _current_version(conn) >= LATEST:
+            return
+    with engine.connect() as conn:
+        # Statements run in autocommit mode at the driver level so that the
+        # explicit BEGIN IMMEDIATE below owns the transaction.
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        _begin_immediate(conn)
+        try:
+            conn.exec_driver_sql(
+                "CREATE TABLE IF NOT EXISTS schema_version ("
+                "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+            )
+            current = _current_version(conn)
+            for version, name, migrate in MIGRATIONS:
+                if version <= current:
+                    continue
+                migrate(conn)
+                conn.exec_driver_sql("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.exec_driver_sql("COMMIT")
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
@@ -1,16 +1,19 @@
 from typing import Optional
 
+from anyio import to_thread
 from fastapi import APIRouter, Depends, Header, HTTPException, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.config import settings
-from app.services.tts import synthesize
-from app.services.transcription import transcribe_audio
+from app.services.tts import cache_key, synthesize_stream
+from app.services.tts_cache import cache
+from app.services import etags, transcription
 
 router = APIRouter()
 
 
-def require_api_key(x_api_key: Optional[str] = Header(default=None)):
+async def require_api_key(x_api_key: Optional[str] = Header(default=None)):
     if settings.API_KEY and x_api_key != settings.API_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -21,34 +24,58 @@ class TTSRequest(BaseModel):
     format: Optional[str] = "mp3"
 
 
-@router.post("/tts", dependencies=[Depends(require_api_key)])
-async def tts(req: TTSRequest):
-    audio = await synthesize(req.text, req.voice or "alloy", req.format or "mp3")
-    if not audio:
-        raise HTTPException(status_code=400, detail="TTS synthesis failed")
-    mt = "audio/mpeg" if (req.format or "mp3").lower() == "mp3" else (
-        "audio/wav" if (req.format or "mp3").lower() == "wav" else "application/octet-stream"
+def _media_type(fmt: str) -> str:
+    return "audio/mpeg" if fmt.lower() == "mp3" else (
+        "audio/wav" if fmt.lower() == "wav" else "application/octet-stream"
     )
-    return Response(content=audio, media_type=mt)
+
+
+async def _tts_response(text: str, voice: str, fmt: str, if_none_match: Optional[str]) -> Response:
+    # The cache key is a content hash, so it doubles as a strong ETag.
+    etag = f'"{cache_key(text, voice, fmt)}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={settings.TTS_CACHE_MAX_AGE}"}
+    if etags.matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    chunks = synthesize_stream(text, voice, fmt)
+    # Pull the first chunk before committing to a 200 so upstream failures
+    # still surface as an error status rather than an empty stream.
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=400, detail="TTS synthesis failed")
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type=_media_type(fmt), headers=headers)
+
+
+@router.post("/tts", dependencies=[Depends(require_api_key)])
+async def tts(req: TTSRequest, if_none_match: Optional[str] = Header(default=None)):
+    return await _tts_response(req.text, req.voice or "alloy", req.format or "mp3", if_none_match)
 
 
 @router.get("/tts")
-async def tts_get(text: str, voice: Optional[str] = "alloy", format: Optional[str] = "mp3", key: Optional[str] = None, x_api_key: Optional[str] = Header(default=None)):
+async def tts_get(text: str, voice: Optional[str] = "alloy", format: Optional[str] = "mp3", key: Optional[str] = None, x_api_key: Optional[str] = Header(default=None), if_none_match: Optional[str] = Header(default=None)):
     if settings.API_KEY:
       if not (x_api_key == settings.API_KEY or key == settings.API_KEY):
           raise HTTPException(status_code=401, detail="Unauthorized")
-    audio = await synthesize(text, voice or "alloy", format or "mp3")
-    if not audio:
-        raise HTTPException(status_code=400, detail="TTS synthesis failed")
-    mt = "audio/mpeg" if (format or "mp3").lower() == "mp3" else (
-        "audio/wav" if (format or "mp3").lower() == "wav" else "application/octet-stream"
-    )
-    return Response(content=audio, media_type=mt)
+    return await _tts_response(text, voice or "alloy", format or "mp3", if_none_match)
+
+
+@router.get("/tts/cache", dependencies=[Depends(require_api_key)])
+async def tts_cache_stats():
+    return await to_thread.run_sync(cache.stats)
 
 
 @router.post("/transcribe", dependencies=[Depends(require_api_key)])
 async def transcribe(file: UploadFile = File(...)):
-    text = await transcribe_audio(file)
+    try:
+        text = await transcription.transcribe_audio(file)
+    except transcription.TranscriptionFailed as e:
+        raise HTTPException(status_code=502, detail=f"Transcription failed: {e}")
     if not text:
         raise HTTPException(status_code=400, detail="Transcription failed")
     return {"text": text}
@@ -1,55 +1,146 @@
-from typing import Optional
-
+import asyncio
+import base64
+import functools
+import time
+from datetime import timezone
+from typing import AsyncIterator, Optional, Tuple
+
+from anyio import to_thread
 from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
 
-from sqlalchemy import text
-from sqlalchemy.exc import OperationalError
-import httpx
+from sqlalchemy import DateTime, bindparam, text
+import hashlib
 import json
 
 from app.config import settings
-from app.db import engine
+from app.db import async_read_engine, fts_user_query
+from app.services import fts_query, query_cache, resilience, singleflight, tts, upstream, vector_index
 from app.schemas import (
+    SearchFilters,
     SearchRequest,
     SearchResponse,
     SearchResult,
     ThoughtOut,
     AssistCommentRequest,
     AssistCommentResponse,
+    AssistCommentStreamRequest,
 )
 
 router = APIRouter()
 
 
-def require_api_key(x_api_key: Optional[str] = Header(default=None)):
+async def require_api_key(x_api_key: Optional[str] = Header(default=None)):
     if settings.API_KEY and x_api_key != settings.API_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
-def get_user_id(x_user_id: Optional[str] = Header(default=None)) -> str:
+async def get_user_id(x_user_id: Optional[str] = Header(default=None)) -> str:
     return x_user_id or "demo"
 
 
+def _parse_list(raw: Optional[str]) -> list:
+    if not raw:
+        return []
+    try:
+        return json.loads(raw) or []
+    except Exception:
+        return []
+
+
+# Optional filters shared by the search endpoints. They are part of the
+# ranked statement's WHERE clause, so rows outside them are dropped as the
+# FTS matches are joined to `thoughts`, before anything is scored or sorted.
+# Tags are resolved through ix_thought_tags_user_tag. Driving the query from
+# the (user_id, created_at) index instead was measured to be slower even
+# for narrow time ranges: FTS5 re-evaluates the MATCH for every rowid.
+_FILTER_SQL = {
+    "since": "t.created_at >= :since",
+    "until": "t.created_at < :until",
+    "source": "t.source = :source",
+    "tags": "t.id IN (SELECT tt.thought_id FROM thought_tags tt WHERE tt.user_id = :uid AND tt.tag IN :tags)",
+}
+
+
+def _filters(req: SearchFilters) -> dict:
+    """The request's filters that are set, normalized for binding: naive UTC
+    datetimes (as stored) and lowercased tags (as in thought_tags)."""
+    out = {}
+    for name in ("since", "until"):
+        value = getattr(req, name)
+        if value is not None:
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            out[name] = value
+    if req.source:
+        out["source"] = req.source
+    tags = sorted({t.strip().lower() for t in req.tags if t and t.strip()})
+    if tags:
+        out["tags"] = tags
+    return out
+
+
+def _filters_key(filters: dict) -> str:
+    """Query-cache discriminator for a set of filters."""
+    return json.dumps(filters, sort_keys=True, default=str) if filters else ""
+
+
+def _where_filters(stmt: str, filters: dict):
+    clauses = "".join(f" AND {_FILTER_SQL[name]}" for name in _FILTER_SQL if name in filters)
+    sql = text(stmt.replace("{filters}", clauses))
+    binds = []
+    if "since" in filters:
+        binds.append(bindparam("since", type_=DateTime()))
+    if "until" in filters:
+        binds.append(bindparam("until", type_=DateTime()))
+    if "tags" in filters:
+        binds.append(bindparam("tags", expanding=True))
+    return sql.bindparams(*binds) if binds else sql
+
+
+@functools.lru_cache(maxsize=None)
+def _ranked_sql(columns: str, filter_names: Tuple[str, ...]):
+    stmt = f"""
+        SELECT {columns}, {fts_query.SCORE_SQL} AS score
+        FROM thoughts_fts
+        JOIN thoughts t ON t.rowid = thoughts_fts.rowid
+        WHERE thoughts_fts MATCH :q AND t.user_id = :uid{{filters}}
+        ORDER BY score DESC
+        LIMIT :k
+        """
+    return _where_filters(stmt, dict.fromkeys(filter_names)).bindparams(bindparam("terms", expanding=True))
+
+
+_SEARCH_COLUMNS = "t.id, t.title, t.created_at, snippet(thoughts_fts, 1, '<b>', '</b>', '…', 10) AS snip"
+_CANDIDATE_COLUMNS = "t.id"
+_COMMENT_COLUMNS = (
+    "t.id, t.user_id, t.source, t.title, t.summary, t.content, "
+    "t.tags_json, t.entities_json, t.interpretation, t.created_at"
+)
+
+
+async def _ranked(columns: str, user_id: str, q: str, k: int, filters: dict) -> list:
+    """Select `columns` of the top `k` FTS matches for the compiled `q`
+    within `filters`, best first."""
+    match, terms = fts_query.compile_query(q)
+    if not match:
+        return []
+    sql = _ranked_sql(columns, tuple(sorted(filters)))
+    params = {"q": fts_user_query(user_id, match), "uid": user_id, "k": k, **fts_query.score_params(terms), **filters}
+    async with async_read_engine.connect() as conn:
+        return (await conn.execute(sql, params)).fetchall()
+
+
 @router.post("/search", response_model=SearchResponse, dependencies=[Depends(require_api_key)])
-def search(req: SearchRequest, user_id: str = Depends(get_user_id)):
-    assert 1 == 2, "Assert statement for debugging search()"
+async def search(req: SearchRequest, user_id: str = Depends(get_user_id)):
     q = (req.query or "").strip()
     if not q:
         return {"results": []}
-    sql = text(
-        """
-        SELECT t.id, t.title, t.created_at,
-               snippet(thoughts_fts, 1, '<b>', '</b>', '…', 10) AS snip,
-               bm25(thoughts_fts) AS score
-        FROM thoughts_fts
-        JOIN thoughts t ON t.id = thoughts_fts.thought_id
-        WHERE t.user_id = :uid AND thoughts_fts MATCH :q
-        ORDER BY score
-        LIMIT :k
-        """
-    )
-    with engine.begin() as conn:
-        rows = conn.execute(sql, {"q": q, "k": req.topK, "uid": user_id}).fetchall()
+    filters = _filters(req)
+    cached = await query_cache.get(user_id, "search", q, req.topK, _filters_key(filters))
+    if cached is not None:
+        return cached
+    rows = await _ranked(_SEARCH_COLUMNS, user_id, q, req.topK, filters)
     results = []
     for r in rows:
         results.append(
@@ -57,44 +148,94 @@ def search(req: SearchRequest, user_id: str = Depends(get_user_id)):
                 thoughtId=r[0], title=r[1], createdAt=r[2], snippet=r[3] or "", score=float(r[4] or 0.0)
             )
         )
-    return {"results": results}
+    out = {"results": [r.model_dump() for r in results]}
+    await query_cache.put(user_id, "search", q, req.topK, out, _filters_key(filters))
+    return out
 
 
-@router.post("/assist-search-full", response_model=list[ThoughtOut], dependencies=[Depends(require_api_key)])
-def assist_search_full(req: SearchRequest, user_id: str = Depends(get_user_id)):
-    q = (req.query or "").strip()
-    if not q:
-        return []
+@router.get("/search/cache", dependencies=[Depends(require_api_key)])
+async def search_cache_stats():
+    return await query_cache.stats()
 
-    # Fetch ALL thoughts for this user
-    sql = text(
-        """
-        SELECT t.id, t.user_id, t.source, t.title, t.summary, t.content,
-               t.tags_json, t.entities_json, t.interpretation, t.created_at
-        FROM thoughts t
-        WHERE t.user_id = :uid
-        ORDER BY t.created_at DESC
-        """
-    )
-    with engine.begin() as conn:
-        rows = conn.execute(sql, {"uid": user_id}).fetchall()
 
-    if not rows:
-        return []
+@router.get("/upstream/coalescing", dependencies=[Depends(require_api_key)])
+async def upstream_coalescing_stats():
+    return singleflight.stats()
+
+
+@router.get("/upstream/health", dependencies=[Depends(require_api_key)])
+async def upstream_health():
+    return resilience.stats()
+
 
-    # Build thoughts list for Groq
-    thoughts_for_groq = []
+_RRF_K = 60
+# How many more vector candidates to fetch when filters will drop some.
+_FILTERED_VECTOR_FACTOR = 4
+# Identical concurrent upstream calls (same prompt) share one request.
+_rerank_flight = singleflight.group("search")
+_comment_flight = singleflight.group("comment")
+
+
+async def _fts_candidates(user_id: str, q: str, n: int, filters: dict) -> list:
+    return [r[0] for r in await _ranked(_CANDIDATE_COLUMNS, user_id, q, n, filters)]
+
+
+def _fuse(rankings: list) -> list:
+    """Reciprocal rank fusion of several best-first id lists."""
+    scores: dict = {}
+    for ranking in rankings:
+        for rank, tid in enumerate(ranking):
+            scores[tid] = scores.get(tid, 0.0) + 1.0 / (_RRF_K + rank + 1)
+    return sorted(scores, key=lambda tid: -scores[tid])
+
+
+def _estimate_tokens(s: str) -> int:
+    return len(s) // 4 + 1
+
+
+def _pack_candidates(rows: list) -> list:
+    """Compact `{index, title, summary}` entries (summary falling back to the
+    start of the content), truncated and added in local rank order until
+    ASSIST_RERANK_TOKEN_BUDGET is spent."""
+    limit = settings.ASSIST_SNIPPET_CHARS
+    budget = settings.ASSIST_RERANK_TOKEN_BUDGET
+    packed = []
     for idx, r in enumerate(rows):
-        thoughts_for_groq.append({
-            "index": idx,
-            "content": r[5] or "",
-        })
+        summary = " ".join((r[4] or r[5] or "").split())
+        entry = {"index": idx, "title": (r[3] or "")[:120], "summary": summary[:limit]}
+        cost = _estimate_tokens(json.dumps(entry))
+        if cost > budget:
+            break
+        budget -= cost
+        packed.append(entry)
+    return packed
+
+
+def _parse_indices(data: dict) -> Optional[list]:
+    choice = (data.get("choices") or [{}])[0]
+    content = ((choice.get("message") or {}).get("content") or "").strip()
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        indices = json.loads(content[start : end + 1]).get("relevant_indices")
+    except (ValueError, AttributeError):
+        return None
+    return indices if isinstance(indices, list) else None
 
-    # Ask Groq which thoughts are relevant
+
+async def _rerank(q: str, top_k: int, rows: list) -> Optional[list]:
+    """Indices into `rows`, best first, as ranked by Groq, or None when the
+    local order should be used instead."""
+    if not settings.GROQ_API_KEY or not settings.GROQ_MODEL:
+        return None
+    packed = _pack_candidates(rows)
+    if not packed:
+        return None
     prompt = (
         f"User query: {q}\n"
-        f"Max results: {req.topK}\n\n"
-        f"Thoughts:\n{json.dumps(thoughts_for_groq)}\n\n"
+        f"Max results: {top_k}\n\n"
+        f"Thoughts:\n{json.dumps(packed)}\n\n"
         "You must return ONLY valid JSON matching this exact schema:\n\n"
         "{\n"
         '  "relevant_indices": [0, 5, 12]\n'
@@ -104,237 +245,150 @@ def assist_search_full(req: SearchRequest, user_id: str = Depends(get_user_id)):
         "- Each integer is an index from the provided thoughts array\n"
         "- Order by relevance (most relevant first)\n"
         "- Be BROAD and INCLUSIVE in your matches - include anything potentially related\n"
-        "- Don't be too strict - if there's even a loose connection, include it\n"
         "- Return up to max_results indices (you can return fewer but try to be generous)\n"
         "- Return empty array [] only if truly nothing is relevant\n\n"
-        "Example output:\n"
-        '{"relevant_indices": [2, 7, 15, 8, 1, 20]}\n\n'
         "Do NOT include any other text, explanation, or formatting. Only return the JSON object."
     )
-
-    print(f"[DEBUG] prompt={prompt}")
-
-    with httpx.Client(timeout=30.0) as client:
-        resp = client.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": settings.GROQ_MODEL,
-                "messages": [
-                    {"role": "user", "content": prompt},
-                ],
+    try:
+        resp = await upstream.chat(
+            "search",
+            {
+                "messages": [{"role": "user", "content": prompt}],
                 "temperature": 0,
-                "max_tokens": 2000,
+                "max_tokens": 16 + 6 * top_k,
                 "response_format": {"type": "json_object"},
             },
+            timeout=settings.ASSIST_RERANK_TIMEOUT,
         )
+        if resp.status_code != 200:
+            return None
+        indices = _parse_indices(resp.json())
+    except Exception:
+        return None
+    if indices is None:
+        return None
+    allowed = {e["index"] for e in packed}
+    return list(dict.fromkeys(i for i in indices if isinstance(i, int) and i in allowed))
 
-    data = resp.json()
-
-    # Flatten entire response to string and search for JSON
-    full_text = str(data).replace("\n", "")
-
-    # Find the JSON object containing "relevant_indices"
-    start = full_text.find('{"relevant_indices"')
-    if start == -1:
-        start = full_text.find("{'relevant_indices'")
-
-    end = full_text.find('}', start) + 1
-    json_str = full_text[start:end]
-
-    result = json.loads(json_str)
-    relevant_indices = result["relevant_indices"]
-
-    print(f"[DEBUG] {relevant_indices=}")
-
-    # Build output using the relevant indices
-    out: list[ThoughtOut] = []
-    for idx in relevant_indices[:req.topK]:
-        r = rows[idx]
-        tags = json.loads(r[6]) if r[6] else []
-        entities = json.loads(r[7]) if r[7] else []
-        out.append(
-            ThoughtOut(
-                id=r[0],
-                user_id=r[1],
-                source=r[2],
-                title=r[3],
-                summary=r[4],
-                content=r[5],
-                tags=tags,
-                entities=entities,
-                interpretation=r[8],
-                created_at=r[9],
-            )
-        )
-    return out
 
-    # === OLD CODE COMMENTED OUT (FTS + Groq query expansion) ===
-    # expanded = q
-    # if settings.GROQ_API_KEY and settings.GROQ_MODEL:
-    #     messages = [
-    #         {
-    #             "role": "system",
-    #             "content": (
-    #                 "Return only JSON with key 'fts'. 'fts' is a concise SQLite FTS query for matching relevant thoughts. "
-    #                 "Use OR between key terms, and quote multi-word phrases."
-    #             ),
-    #         },
-    #         {"role": "user", "content": q},
-    #     ]
-    #     try:
-    #         with httpx.Client(timeout=12.0) as client:
-    #             resp = client.post(
-    #                 "https://api.groq.com/openai/v1/chat/completions",
-    #                 headers={
-    #                     "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-    #                     "Content-Type": "application/json",
-    #                 },
-    #                 json={
-    #                     "model": settings.GROQ_MODEL,
-    #                     "messages": messages,
-    #                     "temperature": 0,
-    #                     "max_tokens": 100,
-    #                     "response_format": {"type": "json_object"},
-    #                 },
-    #             )
-    #         if resp.status_code == 200:
-    #             data = resp.json()
-    #             choice = (data.get("choices") or [{}])[0]
-    #             content = ((choice.get("message") or {}).get("content") or "").strip()
-    #             try:
-    #                 obj = json.loads(content)
-    #                 fts = obj.get("fts")
-    #                 if isinstance(fts, str) and fts.strip():
-    #                     expanded = fts.strip()
-    #             except Exception:
-    #                 pass
-    #     except Exception:
-    #         pass
-
-    # def _sanitize(s: str) -> str:
-    #     # Remove most punctuation and collapse whitespace (keep quotes to allow exact phrases)
-    #     import re
-    #     s2 = re.sub(r'[^A-Za-z0-9\s\"]+', ' ', s)
-    #     s2 = " ".join(s2.split())
-    #     return s2 or q
-
-    # sql = text(
-    #     """
-    #     SELECT t.id, t.user_id, t.source, t.title, t.summary, t.content,
-    #            t.tags_json, t.entities_json, t.interpretation, t.created_at
-    #     FROM thoughts_fts
-    #     JOIN thoughts t ON t.id = thoughts_fts.thought_id
-    #     WHERE t.user_id = :uid AND thoughts_fts MATCH :q
-    #     ORDER BY bm25(thoughts_fts)
-    #     LIMIT :k
-    #     """
-    # )
-    # with engine.begin() as conn:
-    #     try:
-    #         rows = conn.execute(sql, {"q": expanded, "k": req.topK, "uid": user_id}).fetchall()
-    #     except OperationalError:
-    #         # Fallback: sanitize/quote raw query if Groq expansion caused FTS syntax errors
-    #         try:
-    #             cleaned = _sanitize(expanded)
-    #             if not any(ch.isalnum() for ch in cleaned):
-    #                 raise OperationalError("", {}, None)  # force next fallback
-    #             rows = conn.execute(sql, {"q": cleaned, "k": req.topK, "uid": user_id}).fetchall()
-    #         except OperationalError:
-    #             quoted = '"' + q.replace('"', '') + '"'
-    #             rows = conn.execute(sql, {"q": quoted, "k": req.topK, "uid": user_id}).fetchall()
-    # out: list[ThoughtOut] = []
-    # for r in rows:
-    #     tags = []
-    #     entities = []
-    #     try:
-    #         if r[6]:
-    #             tags = json.loads(r[6]) or []
-    #     except Exception:
-    #         tags = []
-    #     try:
-    #         if r[7]:
-    #             entities = json.loads(r[7]) or []
-    #     except Exception:
-    #         entities = []
-    #     out.append(
-    #         ThoughtOut(
-    #             id=r[0],
-    #             user_id=r[1],
-    #             source=r[2],
-    #             title=r[3],
-    #             summary=r[4],
-    #             content=r[5],
-    #             tags=tags,
-    #             entities=entities,
-    #             interpretation=r[8],
-    #             created_at=r[9],
-    #         )
-    #     )
-    # return out
+async def _complete_comment(payload: dict) -> str:
+    resp = await upstream.chat("comment", payload)
+    if resp.status_code != 200:
+        return ""
+    data = resp.json()
+    choice = (data.get("choices") or [{}])[0]
+    return ((choice.get("message") or {}).get("content") or "").strip()
+
+
+def _flight_key(parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _thought_out(r) -> ThoughtOut:
+    return ThoughtOut(
+        id=r[0],
+        user_id=r[1],
+        source=r[2],
+        title=r[3],
+        summary=r[4],
+        content=r[5],
+        tags=_parse_list(r[6]),
+        entities=_parse_list(r[7]),
+        interpretation=r[8],
+        created_at=r[9],
+    )
 
 
-@router.post("/assist-comment", response_model=AssistCommentResponse, dependencies=[Depends(require_api_key)])
-def assist_comment(req: AssistCommentRequest, user_id: str = Depends(get_user_id)):
+@router.post("/assist-search-full", response_model=list[ThoughtOut], dependencies=[Depends(require_api_key)])
+async def assist_search_full(req: SearchRequest, user_id: str = Depends(get_user_id)):
     q = (req.query or "").strip()
     if not q:
-        return {"text": "I couldn't hear a question. Try asking about your notes or projects."}
+        return []
+    filters = _filters(req)
+    cache_extra = _filters_key(filters)
+    cached = await query_cache.get(user_id, "assist-search-full", q, req.topK, cache_extra)
+    if cached is not None:
+        return cached
+
+    # Stage 1: narrow the corpus locally. FTS bm25 and the vector index each
+    # propose candidates and are fused by reciprocal rank, so the prompt size
+    # depends on ASSIST_CANDIDATES rather than on how many thoughts exist.
+    index = vector_index.index_for(user_id)
+    if not index.exists:
+        async with async_read_engine.connect() as conn:
+            corpus = (
+                await conn.execute(
+                    text("SELECT id, title, content, tags_json FROM thoughts WHERE user_id = :uid"),
+                    {"uid": user_id},
+                )
+            ).fetchall()
+        await to_thread.run_sync(
+            index.rebuild,
+            [(r[0], vector_index.thought_text(r[1], r[2], _parse_list(r[3]))) for r in corpus],
+        )
+    n = max(settings.ASSIST_CANDIDATES, req.topK)
+    fts_ids = await _fts_candidates(user_id, q, n, filters)
+    # The vector index knows nothing about the filters: over-fetch and let
+    # the row query below drop what falls outside them.
+    k_vec = max(settings.VECTOR_CANDIDATES, n) * (_FILTERED_VECTOR_FACTOR if filters else 1)
+    vec_hits = index.search(q, k_vec)
+    vec_ids = [tid for tid, _ in vec_hits]
+    candidate_ids = _fuse([fts_ids, vec_ids])
+    if not filters:
+        candidate_ids = candidate_ids[:n]
+    if not candidate_ids:
+        return []
 
-    # First, retrieve topK thoughts like assist-search-full but without GROQ expansion
-    sql = text(
+    sql = _where_filters(
         """
         SELECT t.id, t.user_id, t.source, t.title, t.summary, t.content,
                t.tags_json, t.entities_json, t.interpretation, t.created_at
-        FROM thoughts_fts
-        JOIN thoughts t ON t.id = thoughts_fts.thought_id
-        WHERE t.user_id = :uid AND thoughts_fts MATCH :q
-        ORDER BY bm25(thoughts_fts)
-        LIMIT :k
-        """
-    )
-    with engine.begin() as conn:
-        try:
-            rows = conn.execute(sql, {"q": q, "k": req.topK, "uid": user_id}).fetchall()
-        except OperationalError:
-            # basic sanitization fallback
-            import re
-            cleaned = re.sub(r'[^A-Za-z0-9\s\"]+', ' ', q)
-            cleaned = " ".join(cleaned.split()) or q
-            rows = conn.execute(sql, {"q": cleaned, "k": req.topK, "uid": user_id}).fetchall()
+        FROM thoughts t
+        WHERE t.user_id = :uid AND t.id IN :ids{filters}
+        """,
+        filters,
+    ).bindparams(bindparam("ids", expanding=True))
+    async with async_read_engine.connect() as conn:
+        fetched = (await conn.execute(sql, {"uid": user_id, "ids": candidate_ids, **filters})).fetchall()
+    by_id = {r[0]: r for r in fetched}
+    rows = [by_id[tid] for tid in candidate_ids if tid in by_id][:n]
 
     if not rows:
-        return {"text": "I couldn't find anything relevant to comment on."}
+        return []
+
+    # Stage 2: let Groq rerank the compact candidates; keep the local order
+    # when it is unavailable, slow or returns something unusable.
+    flight_key = _flight_key([q, req.topK, [r[0] for r in rows]])
+    order = await _rerank_flight.do(flight_key, lambda: _rerank(q, req.topK, rows))
+    if order is None:
+        # Nothing vets the candidates now, and the vector index returns its
+        # nearest rows however far they are: vector-only ones must clear
+        # VECTOR_MIN_SCORE.
+        weak = {tid for tid, score in vec_hits if score < settings.VECTOR_MIN_SCORE} - set(fts_ids)
+        return [_thought_out(r) for r in rows if r[0] not in weak][: req.topK]
+    out = [_thought_out(rows[i]) for i in order[: req.topK]]
+    await query_cache.put(user_id, "assist-search-full", q, req.topK, [o.model_dump() for o in out], cache_extra)
+    return out
+
+
+async def _comment_items(user_id: str, q: str, top_k: int, filters: dict) -> list:
+    """The top FTS matches for `q`, as compact notes for the comment prompt."""
+    rows = await _ranked(_COMMENT_COLUMNS, user_id, q, top_k, filters)
 
-    # Build a compact context
     items = []
     for r in rows:
-        try:
-            tags = json.loads(r[6]) if r[6] else []
-        except Exception:
-            tags = []
-        title = r[3] or "(untitled)"
-        content = (r[5] or "").strip()
-        summary = (r[4] or "").strip()
         items.append({
-            "title": title,
-            "summary": summary,
-            "content": content,
-            "tags": tags,
+            "title": r[3] or "(untitled)",
+            "summary": (r[4] or "").strip(),
+            "content": (r[5] or "").strip(),
+            "tags": _parse_list(r[6]),
             "created_at": str(r[9]),
             "source": r[2],
         })
+    return items
 
-    # Use Groq LLM to craft a brief commentary (1–2 sentences)
-    if not settings.GROQ_API_KEY or not settings.GROQ_MODEL:
-        # Fallback local summarization
-        top = items[0]
-        base = top.get("summary") or top.get("content")
-        text = (f"Top match: {top.get('title')}. " + (base[:240] if base else "")).strip()
-        return {"text": text or "Here are some notes I found."}
 
+def _comment_payload(q: str, items: list) -> dict:
     system = (
         "You are a helpful assistant. Given a user query and a short list of notes (title, summary/content, tags), "
         "produce a single concise spoken comment (1–2 sentences, <45 words) that relates the notes to the query. "
@@ -344,35 +398,170 @@ def assist_comment(req: AssistCommentRequest, user_id: str = Depends(get_user_id
         "query": q,
         "notes": items,
     }
+    return {
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": json.dumps(user)},
+        ],
+        "temperature": 0.3,
+        "max_tokens": 120,
+    }
+
+
+def _local_comment(items: list) -> str:
+    top = items[0]
+    base = top.get("summary") or top.get("content")
+    reply = (f"Top match: {top.get('title')}. " + (base[:240] if base else "")).strip()
+    return reply or "Here are some notes I found."
+
+
+_NO_QUERY_REPLY = "I couldn't hear a question. Try asking about your notes or projects."
+_NO_MATCH_REPLY = "I couldn't find anything relevant to comment on."
+
+
+@router.post("/assist-comment", response_model=AssistCommentResponse, dependencies=[Depends(require_api_key)])
+async def assist_comment(req: AssistCommentRequest, user_id: str = Depends(get_user_id)):
+    q = (req.query or "").strip()
+    if not q:
+        return {"text": _NO_QUERY_REPLY}
+    filters = _filters(req)
+    cache_extra = _filters_key(filters)
+    cached = await query_cache.get(user_id, "assist-comment", q, req.topK, cache_extra)
+    if cached is not None:
+        return cached
+
+    items = await _comment_items(user_id, q, req.topK, filters)
+    if not items:
+        out = {"text": _NO_MATCH_REPLY}
+        await query_cache.put(user_id, "assist-comment", q, req.topK, out, cache_extra)
+        return out
+
+    # Use Groq LLM to craft a brief commentary (1–2 sentences)
+    if not settings.GROQ_API_KEY or not settings.GROQ_MODEL:
+        # Fallback local summarization
+        return {"text": _local_comment(items)}
+
+    payload = _comment_payload(q, items)
     try:
-        with httpx.Client(timeout=12.0) as client:
-            resp = client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": settings.GROQ_MODEL,
-                    "messages": [
-                        {"role": "system", "content": system},
-                        {"role": "user", "content": json.dumps(user)},
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 120,
-                },
-            )
-        if resp.status_code == 200:
-            data = resp.json()
-            choice = (data.get("choices") or [{}])[0]
-            content = ((choice.get("message") or {}).get("content") or "").strip()
-            if content:
-                return {"text": content}
+        content = await _comment_flight.do(_flight_key(payload), lambda: _complete_comment(payload))
+        if content:
+            out = {"text": content}
+            await query_cache.put(user_id, "assist-comment", q, req.topK, out, cache_extra)
+            return out
     except Exception:
         pass
 
-    # Final fallback
-    top = items[0]
-    base = top.get("summary") or top.get("content")
-    text = (f"Top match: {top.get('title')}. " + (base[:240] if base else "")).strip()
-    return {"text": text or "Here are some notes I found."}
+    # Final fallback (not cached, so the next call retries Groq)
+    return {"text": _local_comment(items)}
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _comment_tokens(user_id: str, q: str, top_k: int, filters: dict) -> AsyncIterator[str]:
+    """Text of the comment as it is generated, with the same cache and
+    fallbacks as assist_comment."""
+    if not q:
+        yield _NO_QUERY_REPLY
+        return
+    cache_extra = _filters_key(filters)
+    cached = await query_cache.get(user_id, "assist-comment", q, top_k, cache_extra)
+    if cached is not None:
+        yield cached["text"]
+        return
+    items = await _comment_items(user_id, q, top_k, filters)
+    if not items:
+        await query_cache.put(user_id, "assist-comment", q, top_k, {"text": _NO_MATCH_REPLY}, cache_extra)
+        yield _NO_MATCH_REPLY
+        return
+    if not settings.GROQ_API_KEY or not settings.GROQ_MODEL:
+        yield _local_comment(items)
+        return
+    parts = []
+    try:
+        async for delta in upstream.chat_stream("comment", _comment_payload(q, items)):
+            parts.append(delta)
+            yield delta
+    except Exception:
+        if not parts:
+            yield _local_comment(items)
+        return
+    reply = "".join(parts).strip()
+    if reply:
+        await query_cache.put(user_id, "assist-comment", q, top_k, {"text": reply}, cache_extra)
+    else:
+        yield _local_comment(items)
+
+
+@router.post("/assist-comment/stream", dependencies=[Depends(require_api_key)])
+async def assist_comment_stream(req: AssistCommentStreamRequest, user_id: str = Depends(get_user_id)):
+    """Server-Sent Events: `token` events carry text as it is generated. With
+    `audio` set, each completed sentence is also synthesized while the rest
+    is still being generated and sent, in order, as an `audio` event
+    (base64). The final `done` event carries the full text together with
+    time-to-first-token and time-to-first-audio in milliseconds."""
+    q = (req.query or "").strip()
+    voice = req.voice or "alloy"
+    fmt = req.format or "mp3"
+
+    async def events() -> AsyncIterator[bytes]:
+        started = time.perf_counter()
+        ttft = ttfa = None
+        parts: list = []
+        buffer = ""
+        pending: list = []
+        sentences = 0
+
+        def elapsed() -> float:
+            return round((time.perf_counter() - started) * 1000.0, 1)
+
+        def speak(sentence: str) -> None:
+            nonlocal sentences
+            pending.append((sentences, sentence, asyncio.create_task(tts.synthesize(sentence, voice, fmt))))
+            sentences += 1
+
+        async def ready_audio(wait: bool) -> AsyncIterator[bytes]:
+            nonlocal ttfa
+            while pending and (wait or pending[0][2].done()):
+                index, sentence, task = pending.pop(0)
+                try:
+                    audio = await task
+                except Exception:
+                    audio = b""
+                if not audio:
+                    continue
+                if ttfa is None:
+                    ttfa = elapsed()
+                yield _sse(
+                    "audio",
+                    {"index": index, "text": sentence, "format": fmt, "audio": base64.b64encode(audio).decode("ascii")},
+                )
+
+        try:
+            async for delta in _comment_tokens(user_id, q, req.topK, _filters(req)):
+                if ttft is None:
+                    ttft = elapsed()
+                parts.append(delta)
+                yield _sse("token", {"text": delta})
+                if req.audio:
+                    done, buffer = tts.take_sentences(buffer + delta)
+                    for sentence in done:
+                        speak(sentence)
+                    async for event in ready_audio(wait=False):
+                        yield event
+            if req.audio:
+                if buffer.strip():
+                    speak(buffer.strip())
+                async for event in ready_audio(wait=True):
+                    yield event
+            yield _sse("done", {"text": "".join(parts).strip(), "ttftMs": ttft, "ttfaMs": ttfa})
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
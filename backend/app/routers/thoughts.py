@@ -1,132 +1,379 @@
+import base64
 import json
-from typing import List, Optional
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Query, UploadFile, File
-from sqlalchemy.orm import Session
+from anyio import to_thread
+import orjson
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response, UploadFile, File
+from pydantic import ValidationError
+from sqlalchemy import case, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.db import Thought, get_db, upsert_thought_fts, delete_thought_fts
-from app.schemas import CreateResponse, ThoughtCreate, ThoughtOut
-from app.services.metadata import extract_metadata
-from app.services.transcription import transcribe_audio
+from app.db import (
+    EnrichmentJob,
+    Thought,
+    ThoughtEntity,
+    ThoughtTag,
+    async_engine,
+    get_async_db,
+    get_async_read_db,
+)
+from app.schemas import (
+    BatchCreateResponse,
+    CreateResponse,
+    EnrichmentStatusOut,
+    FacetsResponse,
+    PurgeStatusOut,
+    ThoughtCreate,
+    ThoughtOut,
+)
+from app.services import enrichment, etags, metadata_cache, purge, query_cache, transcription, vector_index
+from app.services.metadata import cache_key, fallback_metadata
 
 router = APIRouter()
 
 
-def require_api_key(x_api_key: Optional[str] = Header(default=None)):
+async def require_api_key(x_api_key: Optional[str] = Header(default=None)):
     if settings.API_KEY and x_api_key != settings.API_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
-def get_user_id(x_user_id: Optional[str] = Header(default=None)) -> str:
+async def get_user_id(x_user_id: Optional[str] = Header(default=None)) -> str:
     return x_user_id or "demo"
 
 
-@router.post("/thoughts", response_model=CreateResponse, dependencies=[Depends(require_api_key)])
-def create_thought(
-    payload: ThoughtCreate, db: Session = Depends(get_db), user_id: str = Depends(get_user_id)
-):
-    meta = extract_metadata(payload.content, payload.title)
-    tags_json = json.dumps(meta.get("tags", []), ensure_ascii=False)
-    entities_json = json.dumps(meta.get("entities", []), ensure_ascii=False)
+async def _store_thought(
+    db: AsyncSession, user_id: str, source: str, content: str, provided_title: Optional[str]
+) -> Thought:
+    # Content seen before gets its memoized metadata straight away. Anything
+    # else is persisted with provisional metadata; the enrichment workers
+    # replace it with the LLM's title/summary/tags/entities later.
+    cached = await metadata_cache.get(cache_key(content, provided_title))
+    meta = cached or fallback_metadata(content, provided_title)
     t = Thought(
+        id=str(uuid.uuid4()),
         user_id=user_id,
-        source=payload.source or "manual",
+        source=source,
         title=meta.get("title"),
         summary=meta.get("summary"),
-        content=payload.content,
-        tags_json=tags_json,
-        entities_json=entities_json,
-        interpretation=meta.get("interpretation"),
+        content=content,
+        tags_json=json.dumps(meta.get("tags", []), ensure_ascii=False),
+        entities_json=json.dumps(meta.get("entities", []), ensure_ascii=False),
+        interpretation=meta.get("interpretation") if cached else None,
+        enrichment_status="done" if cached else "pending",
     )
     db.add(t)
-    db.commit()
-    db.refresh(t)
-    upsert_thought_fts(t)
-    return {"thoughtId": t.id}
+    job = None if cached else enrichment.enqueue(db, t, provided_title)
+    await db.commit()
+    if job is not None:
+        enrichment.notify(job.id)
+    await query_cache.invalidate_user(user_id)
+    await to_thread.run_sync(
+        vector_index.add_thought, user_id, t.id, t.title, t.content, meta.get("tags", [])
+    )
+    return t
 
 
-@router.delete("/thoughts/clear", dependencies=[Depends(require_api_key)])
-def clear_thoughts(db: Session = Depends(get_db), user_id: str = Depends(get_user_id)):
-    rows = db.query(Thought).filter(Thought.user_id == user_id).all()
-    ids = [r.id for r in rows]
-    for tid in ids:
-        delete_thought_fts(tid)
-    deleted = (
-        db.query(Thought).filter(Thought.user_id == user_id).delete(synchronize_session=False)
+@router.post("/thoughts", response_model=CreateResponse, dependencies=[Depends(require_api_key)])
+async def create_thought(
+    payload: ThoughtCreate, db: AsyncSession = Depends(get_async_db), user_id: str = Depends(get_user_id)
+):
+    t = await _store_thought(db, user_id, payload.source or "manual", payload.content, payload.title)
+    return {"thoughtId": t.id, "enrichmentStatus": t.enrichment_status}
+
+
+@router.post("/thoughts/batch", response_model=BatchCreateResponse, dependencies=[Depends(require_api_key)])
+async def create_thoughts_batch(items: List[Dict[str, Any]] = Body(...), user_id: str = Depends(get_user_id)):
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_ITEMS} thoughts per batch")
+    results = []
+    valid = []
+    for i, raw in enumerate(items):
+        try:
+            payload = ThoughtCreate.model_validate(raw)
+        except ValidationError as e:
+            results.append({"index": i, "error": "; ".join(err["msg"] for err in e.errors())})
+            continue
+        if not payload.content.strip():
+            results.append({"index": i, "error": "content is empty"})
+            continue
+        valid.append((i, payload, cache_key(payload.content, payload.title)))
+    cached = await metadata_cache.get_many(key for _, _, key in valid)
+    thought_rows = []
+    job_rows = []
+    now = datetime.utcnow()
+    for i, payload, key in valid:
+        hit = cached.get(key)
+        meta = hit or fallback_metadata(payload.content, payload.title)
+        tid = str(uuid.uuid4())
+        thought_rows.append(
+            {
+                "id": tid,
+                "user_id": user_id,
+                "source": payload.source or "manual",
+                "title": meta.get("title"),
+                "summary": meta.get("summary"),
+                "content": payload.content,
+                "tags_json": json.dumps(meta.get("tags", []), ensure_ascii=False) if hit else "[]",
+                "entities_json": json.dumps(meta.get("entities", []), ensure_ascii=False) if hit else "[]",
+                "interpretation": meta.get("interpretation") if hit else None,
+                "enrichment_status": "done" if hit else "pending",
+                "created_at": now,
+            }
+        )
+        if hit:
+            results.append({"index": i, "thoughtId": tid, "enrichmentStatus": "done"})
+            continue
+        job_rows.append(
+            {
+                "id": str(uuid.uuid4()),
+                "thought_id": tid,
+                "user_id": user_id,
+                "provided_title": payload.title,
+                "status": "pending",
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        results.append({"index": i, "thoughtId": tid, "enrichmentStatus": "pending"})
+    if thought_rows:
+        async with async_engine.begin() as conn:
+            await conn.execute(Thought.__table__.insert(), thought_rows)
+            if job_rows:
+                await conn.execute(EnrichmentJob.__table__.insert(), job_rows)
+        for job in job_rows:
+            enrichment.notify(job["id"])
+        await query_cache.invalidate_user(user_id)
+        await to_thread.run_sync(
+            vector_index.add_thoughts,
+            user_id,
+            [
+                (r["id"], vector_index.thought_text(r["title"], r["content"], json.loads(r["tags_json"])))
+                for r in thought_rows
+            ],
+        )
+    results.sort(key=lambda r: r["index"])
+    return {"results": results}
+
+
+@router.get("/metadata/cache", dependencies=[Depends(require_api_key)])
+async def metadata_cache_stats():
+    return await metadata_cache.stats()
+
+
+@router.get(
+    "/thoughts/{thought_id}/enrichment",
+    response_model=EnrichmentStatusOut,
+    dependencies=[Depends(require_api_key)],
+)
+async def enrichment_status(
+    thought_id: str, db: AsyncSession = Depends(get_async_read_db), user_id: str = Depends(get_user_id)
+):
+    t = await db.scalar(select(Thought).where(Thought.id == thought_id, Thought.user_id == user_id))
+    if t is None:
+        raise HTTPException(status_code=404, detail="Thought not found")
+    job = await db.scalar(
+        select(EnrichmentJob)
+        .where(EnrichmentJob.thought_id == thought_id)
+        .order_by(EnrichmentJob.created_at.desc())
+        .limit(1)
     )
-    db.commit()
-    return {"deleted": int(deleted)}
+    return {
+        "thoughtId": t.id,
+        "status": t.enrichment_status,
+        "attempts": job.attempts if job else 0,
+        "error": job.error if job else None,
+    }
+
+
+@router.delete("/thoughts/clear", dependencies=[Depends(require_api_key)])
+async def clear_thoughts(response: Response, user_id: str = Depends(get_user_id)):
+    total = await purge.count_thoughts(user_id)
+    if total <= settings.PURGE_INLINE_MAX:
+        return {"deleted": await purge.clear_inline(user_id)}
+    # Too many rows to delete within a request: purge in the background and
+    # let the client poll GET /thoughts/purge/{purgeId}.
+    job = await purge.start_purge(user_id, total)
+    response.status_code = 202
+    return _purge_out(job)
+
+
+def _purge_out(job) -> dict:
+    return {"purgeId": job.id, "status": job.status, "total": job.total, "deleted": job.deleted or 0, "error": job.error}
+
+
+@router.get("/thoughts/purge/{purge_id}", response_model=PurgeStatusOut, dependencies=[Depends(require_api_key)])
+async def purge_status(purge_id: str, user_id: str = Depends(get_user_id)):
+    job = await purge.get_job(purge_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return _purge_out(job)
+
+
+# Output field -> column for the list view; tags/entities are stored as JSON
+# text and spliced into the response as-is instead of being parsed.
+_LIST_FIELDS = {
+    "id": Thought.id,
+    "user_id": Thought.user_id,
+    "source": Thought.source,
+    "title": Thought.title,
+    "summary": Thought.summary,
+    "content": Thought.content,
+    "tags": Thought.tags_json,
+    "entities": Thought.entities_json,
+    "interpretation": Thought.interpretation,
+    "enrichment_status": Thought.enrichment_status,
+    "created_at": Thought.created_at,
+}
+_JSON_FIELDS = {"tags", "entities"}
+
+
+def _is_json_array(column):
+    # Rows that pass are embedded verbatim with orjson.Fragment; anything
+    # else (legacy or hand-edited rows) is parsed, so one bad row cannot
+    # corrupt the response. CASE keeps json_type away from malformed text.
+    return case((func.json_valid(column) == 1, func.json_type(column) == "array"), else_=False)
+
+
+def _json_list(raw: Optional[str]) -> list:
+    try:
+        value = orjson.loads(raw or "[]")
+    except orjson.JSONDecodeError:
+        return []
+    return value if isinstance(value, list) else []
+
+
+def encode_cursor(created_at: datetime, thought_id: str) -> str:
+    raw = orjson.dumps([created_at.isoformat(), thought_id])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, thought_id = orjson.loads(raw)
+        return datetime.fromisoformat(created_at), str(thought_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.get("/thoughts", response_model=List[ThoughtOut], dependencies=[Depends(require_api_key)])
-def list_thoughts(
+async def list_thoughts(
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return"),
+    tag: Optional[str] = Query(None, description="Only thoughts with this tag"),
+    entity: Optional[str] = Query(None, description="Only thoughts mentioning this entity"),
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_read_db),
     user_id: str = Depends(get_user_id),
 ):
-    rows = (
-        db.query(Thought)
-        .filter(Thought.user_id == user_id)
-        .order_by(Thought.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
+    etag = await etags.for_user(user_id, "thoughts", limit, offset, cursor, fields, tag, entity)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    if fields:
+        wanted = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in wanted if f not in _LIST_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        names = ["id"] + [f for f in wanted if f != "id"]
+    else:
+        names = list(_LIST_FIELDS)
+    cols = [_LIST_FIELDS[n].label(n) for n in names]
+    if "created_at" not in names:
+        cols.append(Thought.created_at.label("created_at"))
+    cols.extend(_is_json_array(_LIST_FIELDS[n]).label(f"{n}_ok") for n in names if n in _JSON_FIELDS)
+    stmt = (
+        select(*cols)
+        .where(Thought.user_id == user_id)
+        .order_by(Thought.created_at.desc(), Thought.id.desc())
+        .limit(limit + 1)
     )
-    out: List[ThoughtOut] = []
-    for r in rows:
-        tags = []
-        entities = []
-        if r.tags_json:
-            try:
-                tags = json.loads(r.tags_json) or []
-            except Exception:
-                tags = []
-        if r.entities_json:
-            try:
-                entities = json.loads(r.entities_json) or []
-            except Exception:
-                entities = []
-        out.append(
-            ThoughtOut(
-                id=r.id,
-                user_id=r.user_id,
-                source=r.source,
-                title=r.title,
-                summary=r.summary,
-                content=r.content,
-                tags=tags,
-                entities=entities,
-                interpretation=r.interpretation,
-                created_at=r.created_at,
+    if tag:
+        stmt = stmt.where(
+            Thought.id.in_(
+                select(ThoughtTag.thought_id).where(
+                    ThoughtTag.user_id == user_id, ThoughtTag.tag == tag.strip().lower()
+                )
             )
         )
+    if entity:
+        stmt = stmt.where(
+            Thought.id.in_(
+                select(ThoughtEntity.thought_id).where(
+                    ThoughtEntity.user_id == user_id, ThoughtEntity.entity == entity.strip().lower()
+                )
+            )
+        )
+    if cursor:
+        after_created, after_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(Thought.created_at, Thought.id) < tuple_(after_created, after_id))
+    elif offset:
+        # Deprecated: kept for older clients; use the cursor instead.
+        stmt = stmt.offset(offset)
+    rows = (await db.execute(stmt)).mappings().all()
+
+    headers = {"ETag": etag, "Cache-Control": etags.CACHE_CONTROL}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last["created_at"], last["id"])
+    out = []
+    for r in rows:
+        item = {}
+        for n in names:
+            v = r[n]
+            if n in _JSON_FIELDS:
+                v = orjson.Fragment(v) if r[f"{n}_ok"] else _json_list(v)
+            elif n == "source" and v is None:
+                v = "manual"
+            item[n] = v
+        out.append(item)
+    return Response(content=orjson.dumps(out), media_type="application/json", headers=headers)
+
+
+@router.get("/thoughts/facets", response_model=FacetsResponse, dependencies=[Depends(require_api_key)])
+async def thought_facets(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_read_db),
+    user_id: str = Depends(get_user_id),
+):
+    """Most used tags and entities with their thought counts, for tag clouds."""
+    etag = await etags.for_user(user_id, "facets", limit)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = etags.CACHE_CONTROL
+    out = {}
+    for name, model, column in (("tags", ThoughtTag, ThoughtTag.tag), ("entities", ThoughtEntity, ThoughtEntity.entity)):
+        n = func.count().label("n")
+        rows = await db.execute(
+            select(column, n)
+            .where(model.user_id == user_id)
+            .group_by(column)
+            .order_by(n.desc(), column)
+            .limit(limit)
+        )
+        out[name] = [{"value": v, "count": c} for v, c in rows]
     return out
 
 
 @router.post("/thoughts/transcribe", response_model=CreateResponse, dependencies=[Depends(require_api_key)])
 async def transcribe_thought(
-    file: UploadFile = File(...), db: Session = Depends(get_db), user_id: str = Depends(get_user_id)
+    file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db), user_id: str = Depends(get_user_id)
 ):
-    text = await transcribe_audio(file)
+    try:
+        text = await transcription.transcribe_audio(file)
+    except transcription.TranscriptionFailed as e:
+        raise HTTPException(status_code=502, detail=f"Transcription failed: {e}")
     if not text:
         raise HTTPException(status_code=400, detail="Transcription failed")
-    meta = extract_metadata(text, None)
-    tags_json = json.dumps(meta.get("tags", []), ensure_ascii=False)
-    entities_json = json.dumps(meta.get("entities", []), ensure_ascii=False)
-    t = Thought(
-        user_id=user_id,
-        source="voice",
-        title=meta.get("title"),
-        summary=meta.get("summary"),
-        content=text,
-        tags_json=tags_json,
-        entities_json=entities_json,
-        interpretation=meta.get("interpretation"),
-    )
-    db.add(t)
-    db.commit()
-    db.refresh(t)
-    upsert_thought_fts(t)
-    return {"thoughtId": t.id}
+    t = await _store_thought(db, user_id, "voice", text, None)
+    return {"thoughtId": t.id, "enrichmentStatus": t.enrichment_status}
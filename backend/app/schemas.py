@@ -20,14 +20,59 @@ class ThoughtOut(BaseModel):
     tags: List[str] = Field(default_factory=list)
     entities: List[str] = Field(default_factory=list)
     interpretation: Optional[str] = None
+    enrichment_status: str = "done"
     created_at: datetime
 
 
 class CreateResponse(BaseModel):
     thoughtId: str
+    enrichmentStatus: str = "done"
 
 
-class SearchRequest(BaseModel):
+class BatchItemResult(BaseModel):
+    index: int
+    thoughtId: Optional[str] = None
+    enrichmentStatus: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchCreateResponse(BaseModel):
+    results: List[BatchItemResult]
+
+
+class EnrichmentStatusOut(BaseModel):
+    thoughtId: str
+    status: str
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class PurgeStatusOut(BaseModel):
+    purgeId: str
+    status: str
+    total: int = 0
+    deleted: int = 0
+    error: Optional[str] = None
+
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class FacetsResponse(BaseModel):
+    tags: List[FacetCount] = []
+    entities: List[FacetCount] = []
+
+
+class SearchFilters(BaseModel):
+    since: Optional[datetime] = Field(None, description="Only thoughts created at or after this time")
+    until: Optional[datetime] = Field(None, description="Only thoughts created before this time")
+    source: Optional[str] = Field(None, description="Only thoughts from this source, e.g. voice")
+    tags: List[str] = Field(default_factory=list, description="Only thoughts with at least one of these tags")
+
+
+class SearchRequest(SearchFilters):
     query: str
     topK: int = 5
 
@@ -44,10 +89,16 @@ class SearchResponse(BaseModel):
     results: List[SearchResult]
 
 
-class AssistCommentRequest(BaseModel):
+class AssistCommentRequest(SearchFilters):
     query: str
     topK: int = 5
 
 
+class AssistCommentStreamRequest(AssistCommentRequest):
+    audio: bool = False
+    voice: Optional[str] = "alloy"
+    format: Optional[str] = "mp3"
+
+
 class AssistCommentResponse(BaseModel):
     text: str
@@ -0,0 +1,25 @@
+import importlib.util
+import sys
+
+# Services that pull in NumPy are registered as lazy modules: importing them
+# (including `from app.services import vector_index`) is free, and the real
+# import happens on first attribute access, i.e. on the first request or
+# background job that needs them rather than at worker boot.
+_LAZY = ("transcription", "vector_index")
+
+
+def _lazy_import(name: str) -> None:
+    fullname = f"{__name__}.{name}"
+    if fullname in sys.modules:
+        return
+    spec = importlib.util.find_spec(fullname)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[fullname] = module
+    loader.exec_module(module)
+    globals()[name] = module
+
+
+for _name in _LAZY:
+    _lazy_import(_name)
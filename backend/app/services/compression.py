@@ -0,0 +1,115 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import settings
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding: brotli when the
+# `brotli` package is installed and the client accepts it, else gzip. Only
+# COMPRESS_MEDIA_TYPES are considered (JSON, plain text, WAV audio; MP3 and
+# other codecs are already compressed, and event streams must not be
+# buffered). Complete bodies under COMPRESS_MIN_BYTES are sent as they are;
+# streamed bodies are compressed chunk by chunk with a flush after each, so
+# streaming audio is not held back.
+
+
+def _accepted(header: str) -> Optional[str]:
+    weights = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=settings.COMPRESS_BROTLI_QUALITY)
+            self._gz = None
+        else:
+            self._br = None
+            # wbits 16+15: zlib writes a gzip header and trailer.
+            self._gz = zlib.compressobj(settings.COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes, last: bool) -> bytes:
+        if self._br is not None:
+            return self._br.process(data) + (self._br.finish() if last else self._br.flush())
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing eligible response bodies; it sits inside
+    MetricsMiddleware so request durations include the encoding."""
+
+    def __init__(self, app):
+        self.app = app
+        self.media_types = {t.strip().lower() for t in settings.COMPRESS_MEDIA_TYPES.split(",") if t.strip()}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if encoder is not None:
+                await send({"type": "http.response.body", "body": encoder.chunk(body, not more), "more_body": more})
+                return
+            headers = MutableHeaders(scope=start)
+            media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+            eligible = (
+                start["status"] not in (204, 206, 304)
+                and media_type in self.media_types
+                and "content-encoding" not in headers
+            )
+            if eligible:
+                headers.add_vary_header("Accept-Encoding")
+            if not eligible or encoding is None or (not more and len(body) < settings.COMPRESS_MIN_BYTES):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            encoder = _Encoder(encoding)
+            data = encoder.chunk(body, not more)
+            headers["Content-Encoding"] = encoding
+            if "content-length" in headers:
+                del headers["content-length"]
+            if not more:
+                headers["Content-Length"] = str(len(data))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # The encoded body is a different byte sequence.
+                headers["ETag"] = f"W/{etag}"
+            await send(start)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,254 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+
+from anyio import to_thread
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import AsyncReadSessionLocal, AsyncSessionLocal, EnrichmentJob, Thought
+from app.services import query_cache, upstream, vector_index
+from app.services.metadata import extract_metadata, extract_metadata_many
+
+# Thoughts are persisted immediately with provisional metadata and an
+# `enrichment_status` of "pending"; a pool of workers fills in the LLM
+# metadata afterwards. Jobs are rows in `enrichment_jobs`, so anything still
+# pending when the process stops is picked up again by the sweeper on boot.
+# The in-memory queue is bounded: when it is full a job simply stays in the
+# table until the sweeper has room for it. A job whose Groq call fails, or
+# whose note the model leaves out of its reply, goes back to pending and is
+# retried after ENRICH_RETRY_DELAY; after ENRICH_MAX_ATTEMPTS the thought is
+# marked "failed" and keeps its provisional metadata. While Groq's circuit is
+# open, jobs are deferred the same way without using up an attempt, so an
+# outage delays enrichment but never completes or fails it. Each worker
+# drains up to ENRICH_PACK_SIZE queued jobs at a time so short notes (bulk
+# imports in particular) are packed into a single LLM request.
+
+_queue: Optional[asyncio.Queue] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_tasks: List[asyncio.Task] = []
+_inflight: Set[str] = set()
+
+
+def enqueue(db: AsyncSession, thought: Thought, provided_title: Optional[str] = None) -> EnrichmentJob:
+    """Add a job for `thought` to the session; the caller commits, then calls notify()."""
+    thought.enrichment_status = "pending"
+    job = EnrichmentJob(thought_id=thought.id, user_id=thought.user_id, provided_title=provided_title)
+    db.add(job)
+    return job
+
+
+def _offer(job_id: str) -> None:
+    if _queue is None or job_id in _inflight:
+        return
+    try:
+        _queue.put_nowait(job_id)
+    except asyncio.QueueFull:
+        return
+    _inflight.add(job_id)
+
+
+def notify(job_id: str) -> None:
+    """Hand a committed job to the workers. Safe to call from worker threads."""
+    if _loop is None:
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        _offer(job_id)
+    else:
+        _loop.call_soon_threadsafe(_offer, job_id)
+
+
+async def _claim(job_ids: List[str]) -> List[Tuple[str, str, Optional[str]]]:
+    async with AsyncSessionLocal() as db:
+        claimed = []
+        jobs = (await db.scalars(select(EnrichmentJob).where(EnrichmentJob.id.in_(job_ids)))).all()
+        for job in jobs:
+            if job.status not in ("pending", "running"):
+                continue
+            thought = await db.get(Thought, job.thought_id)
+            if thought is None:
+                await db.delete(job)
+                continue
+            job.status = "running"
+            job.attempts = (job.attempts or 0) + 1
+            claimed.append((job.id, thought.content, job.provided_title))
+        await db.commit()
+        return claimed
+
+
+async def _complete(results: List[Tuple[str, dict]]) -> None:
+    async with AsyncSessionLocal() as db:
+        done = []
+        for job_id, meta in results:
+            job = await db.get(EnrichmentJob, job_id)
+            if job is None:
+                continue
+            thought = await db.get(Thought, job.thought_id)
+            if thought is not None:
+                thought.title = meta.get("title")
+                thought.summary = meta.get("summary")
+                thought.tags_json = json.dumps(meta.get("tags", []), ensure_ascii=False)
+                thought.entities_json = json.dumps(meta.get("entities", []), ensure_ascii=False)
+                thought.interpretation = meta.get("interpretation")
+                thought.enrichment_status = "done"
+                done.append((thought, meta))
+            await db.delete(job)
+        await db.commit()
+    for user_id in {thought.user_id for thought, _ in done}:
+        await query_cache.invalidate_user(user_id)
+    for thought, meta in done:
+        # Replaces the provisional vector written when the thought was created.
+        await to_thread.run_sync(
+            vector_index.add_thought, thought.user_id, thought.id, thought.title, thought.content, meta.get("tags", [])
+        )
+
+
+async def _fail(job_ids: List[str], error: str) -> None:
+    async with AsyncSessionLocal() as db:
+        jobs = (await db.scalars(select(EnrichmentJob).where(EnrichmentJob.id.in_(job_ids)))).all()
+        for job in jobs:
+            job.error = error[:1000]
+            if (job.attempts or 0) >= settings.ENRICH_MAX_ATTEMPTS:
+                job.status = "failed"
+                thought = await db.get(Thought, job.thought_id)
+                if thought is not None:
+                    thought.enrichment_status = "failed"
+            else:
+                job.status = "pending"
+        await db.commit()
+
+
+async def _defer(job_ids: List[str], error: str) -> None:
+    """Put jobs back without charging the attempt: Groq was not called."""
+    async with AsyncSessionLocal() as db:
+        jobs = (await db.scalars(select(EnrichmentJob).where(EnrichmentJob.id.in_(job_ids)))).all()
+        for job in jobs:
+            job.error = error[:1000]
+            job.attempts = max(0, (job.attempts or 0) - 1)
+            job.status = "pending"
+        await db.commit()
+
+
+async def _enrich(claimed: List[Tuple[str, str, Optional[str]]]) -> None:
+    try:
+        # One budget for the pack, including per-note retries of notes the
+        # batched reply missed, so a slow Groq cannot stall a worker for long.
+        with upstream.budget(settings.UPSTREAM_TIMEOUT_METADATA):
+            if len(claimed) > 1:
+                metas = await extract_metadata_many([(content, title) for _, content, title in claimed])
+            else:
+                _, content, title = claimed[0]
+                metas = [await extract_metadata(content, title)]
+    except upstream.Unavailable as e:
+        await _defer([job_id for job_id, _, _ in claimed], repr(e))
+        return
+    except Exception as e:
+        await _fail([job_id for job_id, _, _ in claimed], repr(e))
+        return
+    results = [(job_id, meta) for (job_id, _, _), meta in zip(claimed, metas)]
+    if any(meta is not None for _, meta in results):
+        await _complete([(job_id, meta) for job_id, meta in results if meta is not None])
+    missed = [job_id for job_id, meta in results if meta is None]
+    if missed:
+        await _fail(missed, "no usable metadata in the model's reply")
+
+
+async def _process(job_ids: List[str]) -> None:
+    claimed = await _claim(job_ids)
+    if not claimed:
+        return
+    # Short notes share one LLM request; longer ones each get their own.
+    short = [c for c in claimed if len(c[1]) <= settings.ENRICH_PACK_MAX_CHARS]
+    long = [c for c in claimed if len(c[1]) > settings.ENRICH_PACK_MAX_CHARS]
+    if short:
+        await _enrich(short)
+    for c in long:
+        await _enrich([c])
+
+
+async def _worker() -> None:
+    while True:
+        job_ids = [await _queue.get()]
+        while len(job_ids) < max(1, settings.ENRICH_PACK_SIZE) and not _queue.empty():
+            job_ids.append(_queue.get_nowait())
+        try:
+            await _process(job_ids)
+        except Exception:
+            pass
+        finally:
+            for job_id in job_ids:
+                _inflight.discard(job_id)
+                _queue.task_done()
+
+
+async def _pending_ids(limit: int) -> List[str]:
+    # Jobs that failed before (they carry an error) wait ENRICH_RETRY_DELAY.
+    retry_before = datetime.utcnow() - timedelta(seconds=settings.ENRICH_RETRY_DELAY)
+    async with AsyncReadSessionLocal() as db:
+        rows = await db.scalars(
+            select(EnrichmentJob.id)
+            .where(
+                EnrichmentJob.status == "pending",
+                or_(EnrichmentJob.error.is_(None), EnrichmentJob.updated_at <= retry_before),
+            )
+            .order_by(EnrichmentJob.created_at)
+            .limit(limit)
+        )
+        return list(rows)
+
+
+async def _reset_running() -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(EnrichmentJob).where(EnrichmentJob.status == "running").values(status="pending")
+        )
+        await db.commit()
+
+
+async def _sweeper() -> None:
+    while True:
+        free = _queue.maxsize - _queue.qsize()
+        if free > 0:
+            try:
+                ids = await _pending_ids(free + len(_inflight))
+            except Exception:
+                ids = []
+            for job_id in ids:
+                _offer(job_id)
+        await asyncio.sleep(settings.ENRICH_SWEEP_INTERVAL)
+
+
+def queue_stats() -> dict:
+    return {
+        "depth": _queue.qsize() if _queue is not None else 0,
+        "capacity": _queue.maxsize if _queue is not None else 0,
+        "inflight": len(_inflight),
+    }
+
+
+async def start() -> None:
+    global _queue, _loop
+    _loop = asyncio.get_running_loop()
+    _queue = asyncio.Queue(maxsize=settings.ENRICH_QUEUE_SIZE)
+    # Jobs left "running" by a previous process never finished; retry them.
+    await _reset_running()
+    for _ in range(max(1, settings.ENRICH_WORKERS)):
+        _tasks.append(asyncio.create_task(_worker()))
+    _tasks.append(asyncio.create_task(_sweeper()))
+
+
+async def stop() -> None:
+    global _queue, _loop
+    for t in _tasks:
+        t.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    _inflight.clear()
+    _queue = None
+    _loop = None
@@ -0,0 +1,40 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+from app.services import query_cache
+
+# Conditional GET for the read endpoints. An ETag is derived from the user's
+# data version (bumped on every change to their thoughts) and the request
+# parameters, both known before any query runs, so a matching If-None-Match
+# is answered with 304 without touching the database. Tags are weak because
+# the compression middleware may re-encode the body. The versions are
+# shared by all workers when WEB_CONCURRENCY > 1 (see query_cache), so a
+# write in one worker changes the tags the others issue.
+
+CACHE_CONTROL = "private, no-cache"
+
+
+async def for_user(user_id: str, *parts) -> str:
+    raw = "\x1f".join([user_id, await query_cache.data_tag(user_id), *(str(p) for p in parts)])
+    return f'W/"{hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of `etag` against an If-None-Match header value."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = _opaque(etag)
+    return any(_opaque(t) == opaque for t in if_none_match.split(","))
+
+
+def not_modified(etag: str, cache_control: str = CACHE_CONTROL) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
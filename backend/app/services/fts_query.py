@@ -0,0 +1,88 @@
+import re
+from typing import List, Tuple
+
+from app.config import settings
+
+# Compiles free-form user queries into FTS5 MATCH expressions, and scores
+# the matches.
+#
+# Every token is emitted inside a quoted FTS5 string, so punctuation, FTS
+# keywords (AND, NOT, NEAR, column filters) and stray quotes in user input
+# can never make the expression invalid and each query runs exactly once.
+#
+# - "double quoted text" becomes a phrase;
+# - a word ending in * becomes a prefix term;
+# - other words are single terms, with common stop words dropped unless
+#   nothing else is left.
+#
+# The parts are OR'ed. bm25 adds up the contribution of every part a row
+# matches, so rows containing all of them still rank first, while a query
+# with one word that appears nowhere still finds the others (the fallback
+# that used to need a second, relaxed query).
+#
+# The expression carries no column filter of its own: pass it through
+# db.fts_user_query, which limits it to the text columns and adds the
+# user_id scope, so a term that happens to equal an owner id matches
+# nothing.
+
+_PART_RE = re.compile(r'"([^"]*)"?|(\w+)(\*?)', re.UNICODE)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_STOP_WORDS = frozenset(
+    """
+    a about after all also am an and any are as at be been before but by can could did do does for from had
+    has have he her him his how i if in into is it its me my no not of on or our out she so some than that
+    the their them then there these they this those to up us was we were what when where which who why will
+    with would you your
+    """.split()
+)
+
+
+def compile_query(q: str) -> Tuple[str, List[str]]:
+    """The FTS5 expression for `q` ("" when it has nothing searchable), to be
+    scoped with db.fts_user_query, and its lowercased words and phrases, for
+    matching against tags."""
+    parts: List[Tuple[str, bool]] = []
+    terms: List[str] = []
+    for m in _PART_RE.finditer(q or ""):
+        phrase, word, star = m.group(1), m.group(2), m.group(3)
+        if word is not None:
+            word = word.lower()
+            terms.append(word)
+            parts.append((f'"{word}"*' if star else f'"{word}"', not star and word in _STOP_WORDS))
+            continue
+        words = [w.lower() for w in _WORD_RE.findall(phrase or "")]
+        if words:
+            terms.append(" ".join(words))
+            parts.append((f'"{" ".join(words)}"', False))
+    kept = [p for p, stop in parts if not stop] or [p for p, _ in parts]
+    return " OR ".join(dict.fromkeys(kept)), list(dict.fromkeys(terms))
+
+
+# Hybrid score of a `thoughts_fts` match joined to `thoughts t`, higher is
+# better: bm25 with per-column weights (title, content, tags; user_id is
+# only used to scope the match), multiplied by a boost for every query term
+# that is one of the thought's tags and by a recency factor (1 for a new
+# thought, 1/2 at SEARCH_RECENCY_HALF_LIFE_DAYS old, 1/3 at twice that, ...)
+# blended in by SEARCH_RECENCY_WEIGHT. Bind `score_params(terms)`, with
+# :terms as an expanding parameter.
+SCORE_SQL = """
+    (-bm25(thoughts_fts, :w_title, :w_content, :w_tags, 0.0))
+    * (1.0 + :tag_boost * (
+        SELECT COUNT(*) FROM thought_tags tt WHERE tt.thought_id = t.id AND tt.tag IN :terms
+    ))
+    * (1.0 - :recency_weight + :recency_weight
+        / (1.0 + MAX(julianday('now') - julianday(t.created_at), 0.0) / :half_life))
+"""
+
+
+def score_params(terms: List[str]) -> dict:
+    return {
+        "w_title": settings.SEARCH_WEIGHT_TITLE,
+        "w_content": settings.SEARCH_WEIGHT_CONTENT,
+        "w_tags": settings.SEARCH_WEIGHT_TAGS,
+        "tag_boost": settings.SEARCH_TAG_BOOST,
+        "terms": terms,
+        "recency_weight": min(1.0, max(0.0, settings.SEARCH_RECENCY_WEIGHT)),
+        "half_life": max(settings.SEARCH_RECENCY_HALF_LIFE_DAYS, 1e-6),
+    }
@@ -3,17 +3,98 @@ import json
 import httpx
 
 from app.config import settings
+from app.services import metadata_cache, singleflight, upstream
 
+# Part of the metadata cache key; bump whenever the prompts below change so
+# results produced by the old prompt are no longer served.
+PROMPT_VERSION = 1
 
-def _fallback(content: str, provided_title: str | None):
+_flight = singleflight.group("metadata")
+
+
+class MetadataError(Exception):
+    """Groq answered with an error status or a reply without usable metadata."""
+
+
+def cache_key(content: str, provided_title: str | None) -> str:
+    return metadata_cache.key_for(content, provided_title, settings.GROQ_MODEL, PROMPT_VERSION)
+
+
+def fallback_metadata(content: str, provided_title: str | None):
     title = provided_title or content.strip().split("\n")[0][:80]
     summary = content.strip()[:200]
     return {"title": title, "summary": summary, "tags": [], "entities": [], "interpretation": content}
 
 
-def extract_metadata(content: str, provided_title: str | None = None):
+def _parse_json_object(text: str):
+    try:
+        return json.loads(text)
+    except Exception:
+        start = text.find("{")
+        end = text.rfind("}")
+        if start != -1 and end != -1 and end > start:
+            try:
+                return json.loads(text[start : end + 1])
+            except Exception:
+                return None
+    return None
+
+
+def _normalize(obj: dict, content: str, provided_title: str | None):
+    title = obj.get("title") or provided_title
+    summary = obj.get("summary") or content[:200]
+    tags = obj.get("tags") or []
+    entities = obj.get("entities") or []
+    interpretation = obj.get("interpretation") or summary or content
+    if not isinstance(tags, list):
+        tags = []
+    if not isinstance(entities, list):
+        entities = []
+    return {
+        "title": title,
+        "summary": summary,
+        "tags": tags,
+        "entities": entities,
+        "interpretation": interpretation,
+    }
+
+
+async def _complete_json(messages: list, max_tokens: int):
+    resp = await upstream.chat(
+        "metadata",
+        {
+            "messages": messages,
+            "temperature": 0.0,
+            "max_tokens": max_tokens,
+            "response_format": {"type": "json_object"},
+        },
+    )
+    if resp.status_code != 200:
+        raise MetadataError(f"metadata request failed with status {resp.status_code}")
+    data = resp.json()
+    choice = (data.get("choices") or [{}])[0]
+    message = choice.get("message") or {}
+    return _parse_json_object(message.get("content") or "")
+
+
+async def extract_metadata(content: str, provided_title: str | None = None):
+    """LLM metadata for one note. Raises MetadataError (or the upstream
+    error) instead of guessing, so the caller can retry later; without a
+    GROQ_API_KEY the heuristic fallback is the result."""
+    key = cache_key(content, provided_title)
+    cached = await metadata_cache.get(key)
+    if cached is not None:
+        return cached
+    return await _extract_uncached(content, provided_title, key)
+
+
+async def _extract_uncached(content: str, provided_title: str | None, key: str):
     if not settings.GROQ_API_KEY:
-        return _fallback(content, provided_title)
+        return fallback_metadata(content, provided_title)
+    return await _flight.do(key, lambda: _extract_llm(content, provided_title, key))
+
+
+async def _extract_llm(content: str, provided_title: str | None, key: str):
     messages = [
         {
             "role": "system",
@@ -26,56 +107,76 @@ def extract_metadata(content: str, provided_title: str | None = None):
         },
         {"role": "user", "content": content},
     ]
+    obj = await _complete_json(messages, 300)
+    if not isinstance(obj, dict):
+        raise MetadataError("metadata reply is not a JSON object")
+    meta = _normalize(obj, content, provided_title)
+    await metadata_cache.put(key, meta)
+    return meta
+
+
+async def extract_metadata_many(items: list[tuple[str, str | None]]):
+    """Extract metadata for several short notes in a single LLM request.
+
+    `items` are `(content, provided_title)` pairs; the result is aligned with
+    them. Cached notes are answered from the metadata cache; notes the model
+    skips or mangles are retried one by one, and are None in the result when
+    that fails too. Raises like extract_metadata when the packed request
+    fails or its reply cannot be parsed.
+    """
+    keys = [cache_key(c, t) for c, t in items]
+    cached = await metadata_cache.get_many(keys)
+    todo = [i for i, key in enumerate(keys) if key not in cached]
+    if len(todo) <= 1 or not settings.GROQ_API_KEY:
+        return [
+            cached[key] if key in cached else await _extract_or_none(c, t, key) for key, (c, t) in zip(keys, items)
+        ]
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a JSON API. You receive a JSON array of notes, each with an 'index' and 'content'. "
+                "Return only a compact JSON object {\"items\": [...]} with one entry per note, each with keys: "
+                "index, title, summary, tags, entities, interpretation. The 'tags' and 'entities' must be arrays "
+                "of strings. 'interpretation' is your concise explanation (1-3 sentences) of what the user meant. "
+                "Do not include any extra text."
+            ),
+        },
+        {"role": "user", "content": json.dumps([{"index": i, "content": items[i][0]} for i in todo])},
+    ]
+    obj = await _complete_json(messages, 300 * len(todo))
+    entries = obj.get("items") if isinstance(obj, dict) else None
+    if not isinstance(entries, list):
+        raise MetadataError("metadata reply has no items list")
+    by_index = {}
+    for entry in entries:
+        if isinstance(entry, dict) and isinstance(entry.get("index"), int):
+            by_index[entry["index"]] = entry
+    out = []
+    fresh = []
+    missing = []
+    for i, (content, provided_title) in enumerate(items):
+        entry = by_index.get(i) if i in todo else None
+        if keys[i] in cached:
+            out.append(cached[keys[i]])
+        elif entry is not None:
+            meta = _normalize(entry, content, provided_title)
+            fresh.append((keys[i], meta))
+            out.append(meta)
+        else:
+            out.append(None)
+            missing.append(i)
+    # Store the batch's results first: they survive a failing retry below.
+    await metadata_cache.put_many(fresh)
+    for i in missing:
+        out[i] = await _extract_or_none(items[i][0], items[i][1], keys[i])
+    return out
+
+
+async def _extract_or_none(content: str, provided_title: str | None, key: str):
+    # Failures specific to this note become None; upstream.Unavailable
+    # propagates, as it applies to every note of the pack.
     try:
-        with httpx.Client(timeout=20.0) as client:
-            resp = client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": settings.GROQ_MODEL,
-                    "messages": messages,
-                    "temperature": 0.0,
-                    "max_tokens": 300,
-                    "response_format": {"type": "json_object"},
-                },
-            )
-        if resp.status_code != 200:
-            return _fallback(content, provided_title)
-        data = resp.json()
-        choice = (data.get("choices") or [{}])[0]
-        message = choice.get("message") or {}
-        text = message.get("content") or ""
-        obj = None
-        try:
-            obj = json.loads(text)
-        except Exception:
-            start = text.find("{")
-            end = text.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                try:
-                    obj = json.loads(text[start : end + 1])
-                except Exception:
-                    obj = None
-        if not isinstance(obj, dict):
-            return _fallback(content, provided_title)
-        title = obj.get("title") or provided_title
-        summary = obj.get("summary") or content[:200]
-        tags = obj.get("tags") or []
-        entities = obj.get("entities") or []
-        interpretation = obj.get("interpretation") or summary or content
-        if not isinstance(tags, list):
-            tags = []
-        if not isinstance(entities, list):
-            entities = []
-        return {
-            "title": title,
-            "summary": summary,
-            "tags": tags,
-            "entities": entities,
-            "interpretation": interpretation,
-        }
-    except Exception:
-        return _fallback(content, provided_title)
+        return await _extract_uncached(content, provided_title, key)
+    except (MetadataError, httpx.HTTPError, ValueError):
+        return None
@@ -0,0 +1,132 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config import settings
+from app.db import AsyncReadSessionLocal, AsyncSessionLocal, MetadataCacheEntry
+
+# Memo of extract_metadata results, persisted in the `metadata_cache` table so
+# a resubmitted transcript or a repeated import is enriched without a Groq
+# call, and always gets the same metadata. The key covers everything the
+# result depends on: normalized content, provided title, model and prompt
+# version (bump PROMPT_VERSION in services.metadata when the prompt changes).
+#
+# Lookups go through the read engine. Hits are remembered in memory and their
+# `last_used` is written with the next put. Once every
+# METADATA_CACHE_MAX_ENTRIES // 16 rows put, that put also trims the table
+# back to METADATA_CACHE_MAX_ENTRIES, least recently used first, so it may run
+# over the limit by that much in between.
+
+hits = 0
+misses = 0
+_touched: Dict[str, datetime] = {}
+_unchecked = 0
+
+
+def key_for(content: str, provided_title: Optional[str], model: str, prompt_version: int) -> str:
+    h = hashlib.sha256()
+    for part in (" ".join(content.split()), (provided_title or "").strip(), model, str(prompt_version)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+async def get_many(keys: Iterable[str]) -> Dict[str, dict]:
+    global hits, misses
+    keys = list(dict.fromkeys(keys))
+    if not settings.METADATA_CACHE_ENABLED or not keys:
+        return {}
+    try:
+        async with AsyncReadSessionLocal() as db:
+            rows = (
+                await db.execute(
+                    select(MetadataCacheEntry.key, MetadataCacheEntry.value_json).where(MetadataCacheEntry.key.in_(keys))
+                )
+            ).all()
+    except SQLAlchemyError:
+        rows = []
+    found = {}
+    for key, value in rows:
+        try:
+            found[key] = json.loads(value)
+        except ValueError:
+            continue
+    now = datetime.utcnow()
+    for key in found:
+        _touched[key] = now
+    hits += len(found)
+    misses += len(keys) - len(found)
+    return found
+
+
+async def get(key: str) -> Optional[dict]:
+    return (await get_many([key])).get(key)
+
+
+async def put_many(entries: List[Tuple[str, dict]]) -> None:
+    if not settings.METADATA_CACHE_ENABLED or not entries:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {"key": key, "value_json": json.dumps(meta, ensure_ascii=False), "created_at": now, "last_used": now}
+        for key, meta in dict(entries).items()
+    ]
+    touched = dict(_touched)
+    _touched.clear()
+    try:
+        await _write(rows, touched)
+    except SQLAlchemyError:
+        # The cache is best effort; a busy or locked database must not fail
+        # the enrichment that produced the result.
+        pass
+
+
+async def _write(rows: List[dict], touched: Dict[str, datetime]) -> None:
+    global _unchecked
+    _unchecked += len(rows)
+    trim = _unchecked >= max(1, settings.METADATA_CACHE_MAX_ENTRIES // 16)
+    if trim:
+        _unchecked = 0
+    async with AsyncSessionLocal() as db:
+        stmt = sqlite_insert(MetadataCacheEntry).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MetadataCacheEntry.key],
+            set_={"value_json": stmt.excluded.value_json, "last_used": stmt.excluded.last_used},
+        )
+        await db.execute(stmt)
+        if touched:
+            table = MetadataCacheEntry.__table__
+            await db.execute(
+                update(table).where(table.c.key == bindparam("k")).values(last_used=bindparam("used")),
+                [{"k": key, "used": used} for key, used in touched.items()],
+            )
+        if trim:
+            beyond = (
+                select(MetadataCacheEntry.key)
+                .order_by(MetadataCacheEntry.last_used.desc())
+                .offset(settings.METADATA_CACHE_MAX_ENTRIES)
+            )
+            await db.execute(delete(MetadataCacheEntry).where(MetadataCacheEntry.key.in_(beyond)))
+        await db.commit()
+
+
+async def put(key: str, meta: dict) -> None:
+    await put_many([(key, meta)])
+
+
+async def stats() -> dict:
+    async with AsyncReadSessionLocal() as db:
+        entries = await db.scalar(select(func.count()).select_from(MetadataCacheEntry))
+    total = hits + misses
+    return {
+        "entries": entries or 0,
+        "maxEntries": settings.METADATA_CACHE_MAX_ENTRIES,
+        "hits": hits,
+        "misses": misses,
+        "hitRate": (hits / total) if total else 0.0,
+    }
@@ -0,0 +1,170 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Minimal in-process metrics registry rendered in the Prometheus text
+# exposition format by GET /metrics. Counters and histograms are updated on
+# the hot path; everything that already keeps its own counts (caches, pools,
+# queues) is read at scrape time through a collector callback instead.
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[Dict[str, str], float]
+
+_DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{{{inner}}}" if inner else ""
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_fmt_labels(key)} {_fmt_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = _DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., sum, count]
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_fmt_labels(key + (('le', _fmt_value(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(series[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {series[-1]}")
+        return lines
+
+
+_metrics: List = []
+# Each collector returns (name, type, help, samples) tuples read at scrape time.
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+
+def counter(name: str, help: str) -> Counter:
+    m = Counter(name, help)
+    _metrics.append(m)
+    return m
+
+
+def histogram(name: str, help: str, buckets: Tuple[float, ...] = _DEFAULT_BUCKETS) -> Histogram:
+    m = Histogram(name, help, buckets)
+    _metrics.append(m)
+    return m
+
+
+def register_collector(fn: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _metrics:
+        lines.extend(m.render())
+    for fn in _collectors:
+        try:
+            families = list(fn())
+        except Exception:
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_fmt_labels(sorted(labels.items()))} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route template, method and status."
+)
+upstream_request_duration = histogram(
+    "upstream_request_duration_seconds", "Latency of Groq calls by service and status."
+)
+upstream_requests = counter(
+    "upstream_requests_total", "Groq calls by service and status (error = no response, rejected = circuit open)."
+)
+upstream_retries = counter("upstream_retries_total", "Groq calls retried, by service.")
+upstream_tokens = counter("upstream_tokens_total", "Tokens reported by Groq usage blocks, by service and kind.")
+db_query_duration = histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time by engine and statement type.",
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing http_request_duration_seconds per route
+    template, measured until the last body chunk so streams count in full."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                method=scope.get("method", ""),
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"]),
+            )
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from anyio import to_thread
+from sqlalchemy import delete, func, select
+
+from app.config import settings
+from app.db import AsyncReadSessionLocal, AsyncSessionLocal, EnrichmentJob, PurgeJob, Thought
+from app.services import query_cache, vector_index
+
+# Clearing an account with many thoughts runs as a purge job: a row in
+# `purge_jobs` plus a task that deletes PURGE_CHUNK_SIZE thoughts per
+# transaction, so the single writer connection is released between chunks
+# and other requests keep flowing. Progress is stored on the row after each
+# chunk; jobs still "running" when the process stops are resumed on boot.
+
+_tasks: Dict[str, asyncio.Task] = {}
+
+
+async def count_thoughts(user_id: str) -> int:
+    async with AsyncReadSessionLocal() as db:
+        return await db.scalar(select(func.count()).select_from(Thought).where(Thought.user_id == user_id)) or 0
+
+
+async def clear_inline(user_id: str) -> int:
+    """Delete all of the user's thoughts (their FTS and tag rows go with them
+    through triggers) and enrichment jobs in one transaction."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(EnrichmentJob).where(EnrichmentJob.user_id == user_id))
+        result = await db.execute(delete(Thought).where(Thought.user_id == user_id))
+        await db.commit()
+    await query_cache.invalidate_user(user_id)
+    await to_thread.run_sync(vector_index.clear_user, user_id)
+    return int(result.rowcount)
+
+
+async def start_purge(user_id: str, total: int) -> PurgeJob:
+    """Create (or return the already running) purge job for `user_id`."""
+    async with AsyncSessionLocal() as db:
+        job = await db.scalar(
+            select(PurgeJob).where(PurgeJob.user_id == user_id, PurgeJob.status == "running").limit(1)
+        )
+        if job is None:
+            job = PurgeJob(user_id=user_id, cutoff=datetime.utcnow(), total=total)
+            db.add(job)
+            await db.commit()
+    _spawn(job.id)
+    return job
+
+
+async def get_job(job_id: str, user_id: str) -> Optional[PurgeJob]:
+    async with AsyncReadSessionLocal() as db:
+        job = await db.get(PurgeJob, job_id)
+    return job if job is not None and job.user_id == user_id else None
+
+
+def _spawn(job_id: str) -> None:
+    task = _tasks.get(job_id)
+    if task is None or task.done():
+        _tasks[job_id] = asyncio.create_task(_run(job_id))
+
+
+async def _delete_chunk(job: PurgeJob) -> List[str]:
+    async with AsyncSessionLocal() as db:
+        ids = list(
+            await db.scalars(
+                select(Thought.id)
+                .where(Thought.user_id == job.user_id, Thought.created_at <= job.cutoff)
+                .limit(max(1, settings.PURGE_CHUNK_SIZE))
+            )
+        )
+        if ids:
+            await db.execute(delete(EnrichmentJob).where(EnrichmentJob.thought_id.in_(ids)))
+            await db.execute(delete(Thought).where(Thought.id.in_(ids)))
+        row = await db.get(PurgeJob, job.id)
+        row.deleted = (row.deleted or 0) + len(ids)
+        if not ids:
+            row.status = "done"
+        await db.commit()
+    return ids
+
+
+async def _run(job_id: str) -> None:
+    async with AsyncSessionLocal() as db:
+        job = await db.get(PurgeJob, job_id)
+    if job is None or job.status != "running":
+        return
+    index = vector_index.index_for(job.user_id)
+    try:
+        while True:
+            ids = await _delete_chunk(job)
+            if not ids:
+                break
+            await query_cache.invalidate_user(job.user_id)
+            await to_thread.run_sync(index.remove, ids)
+            # Let queued requests get at the writer before the next chunk.
+            await asyncio.sleep(0)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(PurgeJob, job_id)
+            if row is not None:
+                row.status = "failed"
+                row.error = repr(e)[:1000]
+                await db.commit()
+    finally:
+        _tasks.pop(job_id, None)
+
+
+async def start() -> None:
+    async with AsyncSessionLocal() as db:
+        ids = list(await db.scalars(select(PurgeJob.id).where(PurgeJob.status == "running")))
+    for job_id in ids:
+        _spawn(job_id)
+
+
+async def stop() -> None:
+    tasks = list(_tasks.values())
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _tasks.clear()
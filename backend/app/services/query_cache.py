@@ -0,0 +1,245 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import orjson
+from anyio import to_thread
+
+from app.config import settings
+
+# Result cache for the search endpoints. Keys embed a per-user data version
+# that is bumped whenever the user's thoughts change, so an entry can never be
+# served after the data it was computed from; the old entries simply age out
+# through LRU/TTL. Values must be JSON-serialisable.
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Per-process LRU with TTL. Versions live in this process only, so use
+    the SQLite backend when several workers serve the same users."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._versions: dict = {}
+        self._lock = threading.Lock()
+        # Versions restart at 0 with the process; the epoch tells them apart.
+        self.epoch = uuid.uuid4().hex
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return _MISSING
+            expires, value = item
+            if expires < time.time():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self, user_id: str) -> int:
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: str) -> int:
+        with self._lock:
+            v = self._versions.get(user_id, 0) + 1
+            self._versions[user_id] = v
+            return v
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Cache shared by every worker on the host through a local SQLite file.
+
+    Calls block on file I/O and on other workers' locks, so the module-level
+    functions run them in worker threads. Entries beyond `max_entries` are
+    trimmed every `max_entries // 16` writes rather than counted on each.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._trim_every = max(1, max_entries // 16)
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_last_used ON entries (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS versions (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        # Versions restart at 0 if the file is recreated; the epoch tells them apart.
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+        self.epoch = self._conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return _MISSING
+            if row[1] < now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return _MISSING
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+        return orjson.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        blob = orjson.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, blob, now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % self._trim_every == 0:
+                self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def version(self, user_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user_id: str) -> int:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO versions (user_id, version) VALUES (?, 1) "
+                "ON CONFLICT(user_id) DO UPDATE SET version = version + 1",
+                (user_id,),
+            )
+            return self._conn.execute("SELECT version FROM versions WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def _make_backend():
+    name = settings.QUERY_CACHE_BACKEND or ("sqlite" if settings.WEB_CONCURRENCY > 1 else "memory")
+    if name == "sqlite":
+        return SQLiteBackend(settings.QUERY_CACHE_PATH, settings.QUERY_CACHE_MAX_ENTRIES)
+    if settings.WEB_CONCURRENCY > 1:
+        # Each worker would only see its own writes: stale search results,
+        # and 304s (services.etags) for thoughts that changed.
+        raise RuntimeError(
+            f"QUERY_CACHE_BACKEND={name!r} keeps versions per process; use 'sqlite' with WEB_CONCURRENCY > 1"
+        )
+    return MemoryBackend(settings.QUERY_CACHE_MAX_ENTRIES)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+hits = 0
+misses = 0
+
+
+def backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _make_backend()
+    return _backend
+
+
+def normalize_query(query: str) -> str:
+    # Quotes and * are kept: they make phrases and prefix terms in FTS queries.
+    return " ".join(re.sub(r"[^\w\s\"*]", " ", (query or "").lower()).split())
+
+
+def _key(user_id: str, endpoint: str, query: str, top_k: int, extra: str) -> str:
+    version = backend().version(user_id)
+    raw = "\x1f".join([user_id, str(version), endpoint, normalize_query(query), str(top_k), extra])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def _run(fn, *args):
+    # The SQLite backend can block, so it runs in a worker thread; the
+    # memory backend is cheap enough to call on the event loop.
+    if isinstance(backend(), SQLiteBackend):
+        return await to_thread.run_sync(fn, *args)
+    return fn(*args)
+
+
+def _get(user_id: str, endpoint: str, query: str, top_k: int, extra: str) -> Any:
+    return backend().get(_key(user_id, endpoint, query, top_k, extra))
+
+
+def _set(user_id: str, endpoint: str, query: str, top_k: int, value: Any, extra: str) -> None:
+    backend().set(_key(user_id, endpoint, query, top_k, extra), value, settings.QUERY_CACHE_TTL)
+
+
+def _data_tag(user_id: str) -> str:
+    b = backend()
+    return f"{b.epoch}.{b.version(user_id)}"
+
+
+async def get(user_id: str, endpoint: str, query: str, top_k: int, extra: str = "") -> Optional[Any]:
+    global hits, misses
+    if not settings.QUERY_CACHE_ENABLED:
+        return None
+    value = await _run(_get, user_id, endpoint, query, top_k, extra)
+    if value is _MISSING:
+        misses += 1
+        return None
+    hits += 1
+    return value
+
+
+async def put(user_id: str, endpoint: str, query: str, top_k: int, value: Any, extra: str = "") -> None:
+    if not settings.QUERY_CACHE_ENABLED:
+        return
+    await _run(_set, user_id, endpoint, query, top_k, value, extra)
+
+
+async def user_version(user_id: str) -> int:
+    return await _run(backend().version, user_id)
+
+
+async def data_tag(user_id: str) -> str:
+    """Opaque token that changes whenever the user's thoughts change, also
+    across restarts; used to build HTTP ETags."""
+    return await _run(_data_tag, user_id)
+
+
+async def invalidate_user(user_id: str) -> None:
+    """Call after any change to the user's thoughts. Synchronous code (startup
+    seeding, scripts) calls backend().bump(user_id) directly."""
+    await _run(backend().bump, user_id)
+
+
+async def stats() -> dict:
+    total = hits + misses
+    return {
+        "backend": "sqlite" if isinstance(backend(), SQLiteBackend) else "memory",
+        "entries": await _run(backend().size),
+        "hits": hits,
+        "misses": misses,
+        "hitRate": (hits / total) if total else 0.0,
+    }
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from app.config import settings
+
+# Building blocks for calling Groq when it is slow or failing, used by
+# services.upstream for every request:
+#
+# - a deadline taken from the caller's latency budget (`budget()`), or the
+#   endpoint's timeout when none is set, that bounds all attempts together;
+# - exponential backoff with full jitter between retries;
+# - a per-endpoint concurrency limit, so one busy feature cannot take every
+#   pooled connection;
+# - a per-endpoint circuit breaker that, after repeated failures, rejects
+#   calls immediately for a cooldown so callers go straight to their local
+#   fallbacks, then lets a single probe through to test recovery.
+
+
+class Unavailable(Exception):
+    """Raised instead of calling Groq: the circuit is open, or no attempt
+    could start before the caller's deadline."""
+
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+@contextmanager
+def budget(seconds: float) -> Iterator[None]:
+    """Bound every upstream call made inside the block to `seconds` from now
+    (or to an enclosing, earlier deadline)."""
+    deadline = time.monotonic() + max(0.0, seconds)
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_for(default_seconds: float) -> float:
+    """The monotonic deadline for a call: the caller's, else now + default."""
+    own = time.monotonic() + default_seconds
+    outer = _deadline.get()
+    return own if outer is None else min(outer, own)
+
+
+def backoff(attempt: int) -> float:
+    """Full-jitter exponential delay before retry number `attempt` (1-based)."""
+    cap = min(settings.UPSTREAM_BACKOFF_MAX, settings.UPSTREAM_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+
+def retryable_status(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class Breaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < settings.UPSTREAM_BREAKER_COOLDOWN:
+                self.rejected += 1
+                return False
+            self.state = "half-open"
+        if self.state == "half-open":
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+        return True
+
+    def success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= settings.UPSTREAM_BREAKER_FAILURES:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """End a call that produced no verdict (cancelled, or never sent)."""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+_breakers: Dict[str, Breaker] = {}
+_limits: Dict[str, asyncio.Semaphore] = {}
+_inflight: Dict[str, int] = {}
+
+
+def breaker(endpoint: str) -> Breaker:
+    b = _breakers.get(endpoint)
+    if b is None:
+        b = _breakers[endpoint] = Breaker(endpoint)
+    return b
+
+
+def _concurrency(endpoint: str) -> int:
+    return {
+        "metadata": settings.UPSTREAM_CONCURRENCY_METADATA,
+        "search": settings.UPSTREAM_CONCURRENCY_SEARCH,
+        "comment": settings.UPSTREAM_CONCURRENCY_COMMENT,
+        "transcription": settings.UPSTREAM_CONCURRENCY_TRANSCRIPTION,
+        "tts": settings.UPSTREAM_CONCURRENCY_TTS,
+    }.get(endpoint, settings.UPSTREAM_CONCURRENCY_DEFAULT)
+
+
+@asynccontextmanager
+async def slot(endpoint: str, deadline: float) -> AsyncIterator[None]:
+    """Hold one of the endpoint's concurrency slots, waiting no later than `deadline`."""
+    sem = _limits.get(endpoint)
+    if sem is None:
+        sem = _limits[endpoint] = asyncio.Semaphore(max(1, _concurrency(endpoint)))
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise Unavailable(f"{endpoint} deadline passed")
+    try:
+        await asyncio.wait_for(sem.acquire(), remaining)
+    except asyncio.TimeoutError:
+        raise Unavailable(f"no {endpoint} slot before the deadline") from None
+    _inflight[endpoint] = _inflight.get(endpoint, 0) + 1
+    try:
+        yield
+    finally:
+        _inflight[endpoint] -= 1
+        sem.release()
+
+
+def reset() -> None:
+    """Drop the limiters, which belong to the event loop that created them."""
+    _limits.clear()
+
+
+def stats() -> dict:
+    return {
+        name: {**b.stats(), "inflight": _inflight.get(name, 0), "limit": _concurrency(name)}
+        for name, b in _breakers.items()
+    }
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Request coalescing for upstream calls: while a call for a key is in flight,
+# identical calls wait on its result instead of starting their own. Waiters
+# are shielded, so a client that disconnects does not cancel the call for
+# everyone else. Nothing is kept once the call finishes; caching completed
+# results is left to the caches in front of each call.
+
+
+class Group:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.collapsed = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _track(self, key: str, fut: asyncio.Future) -> None:
+        self._inflight[key] = fut
+
+        def done(f: asyncio.Future) -> None:
+            if self._inflight.get(key) is f:
+                del self._inflight[key]
+
+        fut.add_done_callback(done)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return `await fn()`, sharing one execution among concurrent callers with the same key."""
+        fut = self.follow(key)
+        if fut is None:
+            self.calls += 1
+            fut = asyncio.ensure_future(fn())
+            self._track(key, fut)
+        return await asyncio.shield(fut)
+
+    def follow(self, key: str) -> Optional[asyncio.Future]:
+        """The in-flight future for `key`, if any (counted as a collapsed call)."""
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.collapsed += 1
+        return fut
+
+    def lead(self, key: str) -> asyncio.Future:
+        """Register the caller as the one producing `key`; it must set the result."""
+        fut = asyncio.get_running_loop().create_future()
+        self.calls += 1
+        self._track(key, fut)
+        return fut
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "collapsed": self.collapsed, "inflight": len(self._inflight)}
+
+
+_groups: Dict[str, Group] = {}
+
+
+def group(name: str) -> Group:
+    g = _groups.get(name)
+    if g is None:
+        g = _groups[name] = Group(name)
+    return g
+
+
+def stats() -> dict:
+    return {name: g.stats() for name, g in sorted(_groups.items())}
@@ -1,29 +1,206 @@
-from typing import Optional
+import asyncio
+import io
+import math
+import os
+import re
+import threading
+import wave
+from typing import BinaryIO, List, Optional, Tuple
 
 import httpx
+import numpy as np
+from anyio import to_thread
 from fastapi import UploadFile
 
 from app.config import settings
+from app.services import upstream
 
+_ENERGY_WINDOW_SECONDS = 0.05
+# A generous speaking rate, used to bound how many words the audio overlap
+# between segments can contain.
+_WORDS_PER_SECOND = 3.0
+_MIN_OVERLAP_WORDS = 2
 
-async def transcribe_audio(file: UploadFile) -> str:
-    if not settings.GROQ_API_KEY:
-        return ""
-    filename = file.filename or "audio.m4a"
-    content_type = file.content_type or "application/octet-stream"
+
+class TranscriptionFailed(Exception):
+    """Groq returned no transcript for the recording or one of its segments."""
+
+
+def _is_wav(f: BinaryIO) -> bool:
+    f.seek(0)
+    head = f.read(12)
+    return head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+
+
+def _window_energies(w: wave.Wave_read) -> Tuple[np.ndarray, int]:
+    """RMS energy per short window, computed a window at a time so the
+    whole recording never has to be held in memory."""
+    rate = w.getframerate()
+    width = w.getsampwidth()
+    channels = w.getnchannels()
+    window = max(1, int(rate * _ENERGY_WINDOW_SECONDS))
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}.get(width)
+    energies = []
+    w.rewind()
+    while True:
+        raw = w.readframes(window)
+        if not raw:
+            break
+        if dtype is None:
+            energies.append(0.0)
+            continue
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+        if width == 1:
+            samples -= 128.0
+        energies.append(float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0)
+    return np.asarray(energies, dtype=np.float32), window
+
+
+def plan_segments(energies: np.ndarray, window: int, rate: int, nframes: int) -> List[Tuple[int, int]]:
+    """Choose `(start, end)` frame ranges of about TRANSCRIBE_SEGMENT_SECONDS,
+    each cut at the quietest window in the last TRANSCRIBE_SILENCE_SEARCH_SECONDS
+    before the target and extended by TRANSCRIBE_OVERLAP_SECONDS past the cut."""
+    seg = int(settings.TRANSCRIBE_SEGMENT_SECONDS * rate)
+    overlap = int(settings.TRANSCRIBE_OVERLAP_SECONDS * rate)
+    search = int(settings.TRANSCRIBE_SILENCE_SEARCH_SECONDS * rate)
+    segments = []
+    start = 0
+    while start < nframes:
+        target = start + seg
+        if target >= nframes:
+            segments.append((start, nframes))
+            break
+        lo = max(start + seg // 2, target - search) // window
+        hi = max(lo + 1, target // window)
+        cut = (lo + int(np.argmin(energies[lo:hi]))) * window if hi <= len(energies) else target
+        cut = max(cut, start + window)
+        segments.append((start, min(nframes, cut + overlap)))
+        start = cut
+    return segments
+
+
+def _plan(f: BinaryIO) -> Tuple[int, Optional[List[Tuple[int, int]]]]:
+    """The sample rate and segments of a long WAV file; no segments for
+    anything else."""
+    if not _is_wav(f):
+        return 0, None
+    try:
+        f.seek(0)
+        with wave.open(f, "rb") as w:
+            rate, nframes = w.getframerate(), w.getnframes()
+            if nframes <= settings.TRANSCRIBE_SEGMENT_SECONDS * rate:
+                return rate, None
+            energies, window = _window_energies(w)
+            return rate, plan_segments(energies, window, rate, nframes)
+    except (wave.Error, EOFError):
+        return 0, None
+
+
+def _segment_wav(f: BinaryIO, lock: threading.Lock, start: int, end: int) -> bytes:
+    # Segments are cut concurrently from the one upload file; `lock` guards
+    # its position.
+    with lock:
+        f.seek(0)
+        with wave.open(f, "rb") as src:
+            src.setpos(start)
+            frames = src.readframes(end - start)
+            params = src.getparams()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as dst:
+        dst.setnchannels(params.nchannels)
+        dst.setsampwidth(params.sampwidth)
+        dst.setframerate(params.framerate)
+        dst.writeframes(frames)
+    return buf.getvalue()
+
+
+def _words(text: str) -> List[str]:
+    return [re.sub(r"[^\w']", "", w).lower() for w in text.split()]
+
+
+def _max_overlap_words() -> int:
+    return max(_MIN_OVERLAP_WORDS, math.ceil(settings.TRANSCRIBE_OVERLAP_SECONDS * _WORDS_PER_SECOND * 2))
+
+
+def stitch(texts: List[str], max_overlap_words: Optional[int] = None) -> str:
+    """Join segment transcripts, dropping the words each one repeats from the
+    end of the previous segment (the audio overlap).
+
+    Only a run of at least _MIN_OVERLAP_WORDS, and no longer than the words
+    TRANSCRIBE_OVERLAP_SECONDS of speech can hold (with a 2x margin), counts
+    as the overlap, so speech genuinely repeated across a boundary is kept.
+    """
+    limit = max_overlap_words if max_overlap_words is not None else _max_overlap_words()
+    out: List[str] = []
+    for text in texts:
+        words = text.split()
+        if out and words:
+            prev = _words(" ".join(out[-limit:]))
+            cur = _words(" ".join(words[:limit]))
+            for k in range(min(len(prev), len(cur)), _MIN_OVERLAP_WORDS - 1, -1):
+                if prev[-k:] == cur[:k]:
+                    words = words[k:]
+                    break
+        out.extend(words)
+    return " ".join(out)
+
+
+async def _transcribe_bytes(filename: str, payload, content_type: str) -> str:
     data = {"model": getattr(settings, "GROQ_STT_MODEL", "whisper-large-v3-turbo")}
-    payload = await file.read()
     files = {"file": (filename, payload, content_type)}
-    headers = {"Authorization": f"Bearer {settings.GROQ_API_KEY}"}
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        resp = await client.post(
-            "https://api.groq.com/openai/v1/audio/transcriptions",
-            headers=headers,
-            data=data,
-            files=files,
-        )
+    try:
+        resp = await upstream.post("transcription", "/audio/transcriptions", data=data, files=files)
+    except (httpx.HTTPError, upstream.Unavailable) as e:
+        raise TranscriptionFailed(repr(e)) from e
+    if resp.status_code != 200:
+        raise TranscriptionFailed(f"transcription request failed with status {resp.status_code}")
     try:
         js = resp.json()
-    except Exception:
-        return ""
+    except ValueError as e:
+        raise TranscriptionFailed("transcription reply is not JSON") from e
     return js.get("text") or ""
+
+
+async def transcribe_file(f: BinaryIO, filename: str, content_type: str) -> str:
+    """Transcribe the seekable file `f`, in parallel segments when it is a
+    long WAV recording. Raises TranscriptionFailed if any part of it fails, rather
+    than returning a transcript with a gap."""
+    # Scanning and cutting the audio is CPU-bound (seconds for an hour of
+    # audio), so both run in worker threads rather than on the event loop.
+    rate, segments = await to_thread.run_sync(_plan, f)
+    if not segments or len(segments) == 1:
+        # Short or non-PCM audio: one request, streamed from the file.
+        f.seek(0)
+        return await _transcribe_bytes(filename, f, content_type)
+
+    sem = asyncio.Semaphore(max(1, settings.TRANSCRIBE_PARALLELISM))
+    stem = os.path.splitext(filename)[0] or "audio"
+    lock = threading.Lock()
+
+    async def run(i: int, start: int, end: int) -> str:
+        async with sem:
+            chunk = await to_thread.run_sync(_segment_wav, f, lock, start, end)
+            try:
+                return await _transcribe_bytes(f"{stem}-{i}.wav", chunk, "audio/wav")
+            except TranscriptionFailed as e:
+                raise TranscriptionFailed(f"segment at {start / rate:.0f}s-{end / rate:.0f}s: {e}") from e
+
+    tasks = [asyncio.ensure_future(run(i, s, e)) for i, (s, e) in enumerate(segments)]
+    try:
+        texts = await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+    # Only silent segments are empty here; failed ones raised above.
+    return stitch([t for t in texts if t])
+
+
+async def transcribe_audio(file: UploadFile) -> str:
+    """Transcribe an upload in place: Starlette has already spooled it (within
+    UPLOAD_MAX_BYTES, see services.upload_limit), so it is not copied again."""
+    if not settings.GROQ_API_KEY:
+        return ""
+    filename = file.filename or "audio.m4a"
+    content_type = file.content_type or "application/octet-stream"
+    return await transcribe_file(file.file, filename, content_type)
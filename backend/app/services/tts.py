@@ -1,31 +1,177 @@
+import asyncio
+import re
+from typing import AsyncIterator, List, Tuple
+
 import httpx
+from anyio import to_thread
 
 from app.config import settings
+from app.services import singleflight, upstream
+from app.services.tts_cache import cache
 
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+# Formats whose streams can be concatenated back to back and still play
+# as one clip (no per-file header), so sentences can be synthesized apart.
+_CONCATENABLE = {"mp3", "aac"}
+# Keyed by cache_key, shared by synthesize and synthesize_stream, so a clip
+# is requested from Groq once however many callers want it at that moment.
+_flight = singleflight.group("tts")
 
-async def synthesize(text: str, voice: str = "alloy", fmt: str = "mp3") -> bytes:
-    if not settings.GROQ_API_KEY:
-        return b""
-    payload = {
+
+def cache_key(text: str, voice: str = "alloy", fmt: str = "mp3") -> str:
+    return cache.key_for(text, voice, fmt, getattr(settings, "GROQ_TTS_MODEL", "playai-tts"))
+
+
+def _payload(text: str, voice: str, fmt: str) -> dict:
+    return {
         "model": getattr(settings, "GROQ_TTS_MODEL", "playai-tts"),
         "input": text,
         "voice": voice,
         "format": fmt,
     }
-    headers = {
-        "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        resp = await client.post(
-            "https://api.groq.com/openai/v1/audio/speech",
-            headers=headers,
-            json=payload,
-        )
+
+
+def split_sentences(text: str, min_chars: int = 40) -> List[str]:
+    """Split on sentence boundaries, merging fragments shorter than `min_chars`
+    into the next sentence so tiny clips don't each cost an upstream call."""
+    out: List[str] = []
+    buf = ""
+    for part in _SENTENCE_END_RE.split(text.strip()):
+        buf = f"{buf} {part}".strip() if buf else part
+        if len(buf) >= min_chars:
+            out.append(buf)
+            buf = ""
+    if buf:
+        if out and len(buf) < min_chars:
+            out[-1] = f"{out[-1]} {buf}"
+        else:
+            out.append(buf)
+    return out
+
+
+def take_sentences(buffer: str, min_chars: int = 40) -> Tuple[List[str], str]:
+    """Split complete sentences off the front of a growing `buffer`.
+
+    Returns `(sentences, rest)`; `rest` holds the unfinished tail (and any
+    sentences still shorter than `min_chars`) to be completed by later text.
+    """
+    parts = _SENTENCE_END_RE.split(buffer)
+    out: List[str] = []
+    pending = ""
+    for part in parts[:-1]:
+        pending = f"{pending} {part}".strip() if pending else part
+        if len(pending) >= min_chars:
+            out.append(pending)
+            pending = ""
+    rest = parts[-1]
+    if pending:
+        rest = f"{pending} {rest}" if rest else f"{pending} "
+    return out, rest
+
+
+async def synthesize(text: str, voice: str = "alloy", fmt: str = "mp3") -> bytes:
+    key = cache_key(text, voice, fmt)
+    cached = await to_thread.run_sync(cache.get, key)
+    if cached is not None:
+        return cached
+    if not settings.GROQ_API_KEY:
+        return b""
+    return await _flight.do(key, lambda: _fetch(key, text, voice, fmt))
+
+
+async def _fetch(key: str, text: str, voice: str, fmt: str) -> bytes:
+    try:
+        resp = await upstream.post("tts", "/audio/speech", json=_payload(text, voice, fmt))
+    except (httpx.HTTPError, upstream.Unavailable):
+        return b""
     if resp.status_code == 200 and resp.content:
+        await to_thread.run_sync(cache.put, key, resp.content)
         return resp.content
     try:
         _ = resp.json()
     except Exception:
         pass
     return b""
+
+
+async def _stream_one(text: str, voice: str, fmt: str) -> AsyncIterator[bytes]:
+    sent = False
+    try:
+        async with upstream.stream("tts", "/audio/speech", json=_payload(text, voice, fmt)) as resp:
+            if resp.status_code != 200:
+                return
+            async for chunk in resp.aiter_bytes(settings.TTS_STREAM_CHUNK_BYTES):
+                if chunk:
+                    sent = True
+                    yield chunk
+    except (httpx.HTTPError, upstream.Unavailable):
+        # Nothing sent yet: end empty, like an error status. A stream cut
+        # off midway still fails loudly rather than as a truncated clip.
+        if sent:
+            raise
+
+
+async def synthesize_stream(text: str, voice: str = "alloy", fmt: str = "mp3") -> AsyncIterator[bytes]:
+    """Yield audio as it is produced.
+
+    The first sentence is streamed straight from Groq; later sentences are
+    synthesized ahead (up to TTS_STREAM_PREFETCH at once) while earlier ones
+    are being sent. Formats that cannot be concatenated are streamed as a
+    single request. A complete clip is written to the cache at the end.
+    Callers arriving while the same clip is being produced wait for it and
+    receive it in one piece.
+    """
+    key = cache_key(text, voice, fmt)
+    cached = await to_thread.run_sync(cache.get, key)
+    if cached is not None:
+        yield cached
+        return
+    if not settings.GROQ_API_KEY:
+        return
+    shared = _flight.follow(key)
+    if shared is not None:
+        try:
+            audio = await asyncio.wait_for(asyncio.shield(shared), settings.UPSTREAM_TIMEOUT_TTS)
+        except asyncio.TimeoutError:
+            return
+        if audio:
+            yield audio
+        return
+    leader = _flight.lead(key)
+    sentences = split_sentences(text) if fmt.lower() in _CONCATENABLE else [text]
+    pending: List[asyncio.Task] = []
+    produced: List[bytes] = []
+    complete = False
+    try:
+        rest = iter(sentences[1:])
+
+        def refill() -> None:
+            while len(pending) < max(1, settings.TTS_STREAM_PREFETCH):
+                nxt = next(rest, None)
+                if nxt is None:
+                    return
+                pending.append(asyncio.create_task(synthesize(nxt, voice, fmt)))
+
+        refill()
+        async for chunk in _stream_one(sentences[0], voice, fmt):
+            produced.append(chunk)
+            yield chunk
+        if not produced:
+            return
+        while pending:
+            audio = await pending.pop(0)
+            refill()
+            if not audio:
+                return
+            produced.append(audio)
+            yield audio
+        complete = True
+    finally:
+        for t in pending:
+            t.cancel()
+        clip = b"".join(produced) if complete else b""
+        leader.set_result(clip)
+    # Outside the finally: a stream cut short has nothing to store, and
+    # nothing should be awaited while it is being cancelled.
+    if clip:
+        await to_thread.run_sync(cache.put, key, clip)
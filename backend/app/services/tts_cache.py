@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+
+
+class TTSCache:
+    """Content-addressed, disk-backed cache of synthesized audio.
+
+    Entries are files named by the hash of (text, voice, format, model). An
+    in-memory OrderedDict mirrors the directory in least-recently-used order
+    (seeded from file mtimes on start, which `get` refreshes), and the oldest
+    entries are evicted whenever the total size exceeds `max_bytes`.
+
+    Every method touches the disk and blocks; async callers run them with
+    `to_thread.run_sync`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._loaded = False
+
+    @staticmethod
+    def key_for(text: str, voice: str, fmt: str, model: str) -> str:
+        h = hashlib.sha256()
+        for part in (text, voice, fmt, model):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        for p in self.directory.glob("*.bin"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, p.stem, st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._path(key).unlink(missing_ok=True)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                self._bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if not data or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._load()
+            path = self._path(key)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            except OSError:
+                tmp.unlink(missing_ok=True)
+                return
+            self._bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": (self.hits / total) if total else 0.0,
+            }
+
+
+cache = TTSCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES)
@@ -0,0 +1,58 @@
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app.config import settings
+
+# FastAPI parses (and Starlette spools) a multipart body before the route
+# or any of its dependencies run, so a size check in the handler comes too
+# late to save memory or disk. This middleware rejects multipart requests
+# over UPLOAD_MAX_BYTES up front from Content-Length, and stops reading
+# chunked bodies as soon as they pass the limit.
+
+
+class UploadLimitMiddleware:
+    """ASGI middleware answering oversized multipart uploads with 413."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        headers = Headers(scope=scope) if scope["type"] == "http" else None
+        if headers is None or not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        limit = settings.UPLOAD_MAX_BYTES
+        too_large = JSONResponse({"detail": f"Upload exceeds {limit} bytes"}, status_code=413)
+        try:
+            declared = int(headers.get("content-length", ""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > limit:
+            await too_large(scope, receive, send)
+            return
+        received = 0
+        rejected = False
+
+        async def receive_wrapper():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Answer now; the app sees a disconnect and gives up parsing.
+                    rejected = True
+                    await too_large(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def send_wrapper(message):
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            if not rejected:
+                raise
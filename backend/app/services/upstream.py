@@ -0,0 +1,255 @@
+import asyncio
+import json as jsonlib
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+from app.services import metrics, resilience
+from app.services.resilience import Unavailable, budget  # noqa: F401  (re-exported for callers)
+
+# Shared connection pool for every Groq call. Opened and closed by the app's
+# startup/shutdown hooks; `get_client()` also creates it lazily so scripts and
+# one-off callers work without the app running.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _timeouts() -> Dict[str, float]:
+    return {
+        "metadata": settings.UPSTREAM_TIMEOUT_METADATA,
+        "search": settings.UPSTREAM_TIMEOUT_SEARCH,
+        "comment": settings.UPSTREAM_TIMEOUT_COMMENT,
+        "transcription": settings.UPSTREAM_TIMEOUT_TRANSCRIPTION,
+        "tts": settings.UPSTREAM_TIMEOUT_TTS,
+    }
+
+
+def _attempt_timeout(deadline: float) -> httpx.Timeout:
+    remaining = max(0.001, deadline - time.monotonic())
+    return httpx.Timeout(remaining, connect=min(remaining, settings.UPSTREAM_CONNECT_TIMEOUT))
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=settings.GROQ_BASE_URL.rstrip("/"),
+        headers={"Authorization": f"Bearer {settings.GROQ_API_KEY}"},
+        http2=settings.UPSTREAM_HTTP2 and _http2_available(),
+        limits=httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(settings.UPSTREAM_TIMEOUT_DEFAULT, connect=settings.UPSTREAM_CONNECT_TIMEOUT),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def startup() -> None:
+    get_client()
+
+
+async def shutdown() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    resilience.reset()
+
+
+def _record(endpoint: str, status: str, started: float) -> None:
+    metrics.upstream_request_duration.observe(time.perf_counter() - started, service=endpoint, status=status)
+    metrics.upstream_requests.inc(service=endpoint, status=status)
+
+
+def _record_usage(endpoint: str, usage: Any) -> None:
+    if not isinstance(usage, dict):
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = usage.get(kind)
+        if isinstance(n, int):
+            metrics.upstream_tokens.inc(n, service=endpoint, kind=kind.split("_")[0])
+
+
+# A retry is only worth starting if at least this much of the deadline is left.
+_MIN_ATTEMPT_SECONDS = 0.5
+
+
+def _admit(endpoint: str, timeout: Optional[float]) -> float:
+    """Check the endpoint's circuit and return the call's deadline."""
+    if not resilience.breaker(endpoint).allow():
+        metrics.upstream_requests.inc(service=endpoint, status="rejected")
+        raise Unavailable(f"{endpoint} circuit open")
+    if timeout is None:
+        timeout = _timeouts().get(endpoint, settings.UPSTREAM_TIMEOUT_DEFAULT)
+    return resilience.deadline_for(timeout)
+
+
+async def _send(
+    endpoint: str,
+    deadline: float,
+    send: Callable[[httpx.Timeout], Awaitable[httpx.Response]],
+    streamed: bool = False,
+) -> Tuple[httpx.Response, float]:
+    """Run `send` until it gets a non-retryable answer, retries run out or the
+    next attempt would start too close to `deadline`; report the outcome to
+    the breaker. Returns the response and when its attempt started.
+
+    Transport errors other than timeouts are retried like 429/5xx; the last
+    one is re-raised. Streamed responses are recorded by the caller on close.
+    """
+    breaker = resilience.breaker(endpoint)
+    attempt = 0
+    while True:
+        attempt += 1
+        started = time.perf_counter()
+        resp: Optional[httpx.Response] = None
+        error: Optional[httpx.TransportError] = None
+        try:
+            resp = await send(_attempt_timeout(deadline))
+        except httpx.TransportError as e:
+            _record(endpoint, "error", started)
+            error = e
+        else:
+            if not streamed:
+                _record(endpoint, str(resp.status_code), started)
+        if resp is not None and not resilience.retryable_status(resp.status_code):
+            breaker.success()
+            return resp, started
+        delay = resilience.backoff(attempt)
+        if resp is not None:
+            delay = max(delay, resilience.retry_after(resp.headers.get("Retry-After")) or 0.0)
+        if (
+            attempt > settings.UPSTREAM_RETRIES
+            or isinstance(error, httpx.TimeoutException)
+            or time.monotonic() + delay + _MIN_ATTEMPT_SECONDS > deadline
+        ):
+            breaker.failure()
+            if error is not None:
+                raise error
+            return resp, started
+        if streamed and resp is not None:
+            await resp.aclose()
+            _record(endpoint, str(resp.status_code), started)
+        metrics.upstream_retries.inc(service=endpoint)
+        await asyncio.sleep(delay)
+
+
+def _rewind(files: Any) -> None:
+    # File objects are read to the end by a failed attempt.
+    for value in (files or {}).values():
+        payload = value[1] if isinstance(value, tuple) and len(value) > 1 else value
+        if hasattr(payload, "seek"):
+            payload.seek(0)
+
+
+async def post(
+    endpoint: str,
+    path: str,
+    *,
+    json: Any = None,
+    data: Any = None,
+    files: Any = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    """POST to `path` (relative to GROQ_BASE_URL) within `timeout` seconds (by
+    default the endpoint's timeout, capped by any enclosing `budget()`),
+    retrying 429/5xx and connection errors. Raises Unavailable when the
+    endpoint's circuit is open or no slot frees up in time."""
+    deadline = _admit(endpoint, timeout)
+
+    async def send(attempt_timeout: httpx.Timeout) -> httpx.Response:
+        _rewind(files)
+        return await get_client().post(path, json=json, data=data, files=files, timeout=attempt_timeout)
+
+    try:
+        async with resilience.slot(endpoint, deadline):
+            resp, _ = await _send(endpoint, deadline, send)
+            return resp
+    finally:
+        resilience.breaker(endpoint).release()
+
+
+async def chat(endpoint: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+    body = {"model": settings.GROQ_MODEL, **payload}
+    resp = await post(endpoint, "/chat/completions", json=body, timeout=timeout)
+    if resp.status_code == 200:
+        try:
+            _record_usage(endpoint, resp.json().get("usage"))
+        except (ValueError, AttributeError):
+            pass
+    return resp
+
+
+@asynccontextmanager
+async def stream(
+    endpoint: str,
+    path: str,
+    *,
+    json: Any = None,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[httpx.Response]:
+    """POST to `path` and yield the response before its body is read.
+
+    Retries and the circuit breaker apply as in `post` until the response
+    headers arrive; the endpoint's slot is held until the body is closed.
+    """
+    deadline = _admit(endpoint, timeout)
+
+    async def send(attempt_timeout: httpx.Timeout) -> httpx.Response:
+        request = get_client().build_request("POST", path, json=json, timeout=attempt_timeout)
+        return await get_client().send(request, stream=True)
+
+    try:
+        async with resilience.slot(endpoint, deadline):
+            resp, started = await _send(endpoint, deadline, send, streamed=True)
+            try:
+                yield resp
+            finally:
+                await resp.aclose()
+                _record(endpoint, str(resp.status_code), started)
+    finally:
+        resilience.breaker(endpoint).release()
+
+
+async def chat_stream(endpoint: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """Yield the content deltas of a streamed chat completion.
+
+    Raises httpx.HTTPStatusError when Groq answers with an error status.
+    """
+    body = {"model": settings.GROQ_MODEL, **payload, "stream": True}
+    async with stream(endpoint, "/chat/completions", json=body, timeout=timeout) as resp:
+        if resp.status_code != 200:
+            await resp.aread()
+            resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            try:
+                chunk = jsonlib.loads(data)
+            except ValueError:
+                continue
+            # Groq reports usage on the last chunk, under x_groq.
+            _record_usage(endpoint, chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage"))
+            choice = (chunk.get("choices") or [{}])[0]
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                yield delta
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """Offline bag-of-words embedder using the hashing trick.
+
+    Words and short word prefixes (a cheap stand-in for stemming) are hashed
+    into a fixed number of signed buckets, weighted by log term frequency and
+    L2-normalised, so cosine similarity is a plain dot product.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512, prefix_len: int = 5):
+        self.dim = dim
+        self.prefix_len = prefix_len
+
+    def _features(self, text: str) -> Dict[str, int]:
+        feats: Dict[str, int] = {}
+        for tok in _TOKEN_RE.findall((text or "").lower()):
+            feats[tok] = feats.get(tok, 0) + 1
+            if len(tok) > self.prefix_len:
+                p = "p:" + tok[: self.prefix_len]
+                feats[p] = feats.get(p, 0) + 1
+        return feats
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feat, tf in self._features(text).items():
+                h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+                sign = 1.0 if (h >> 63) & 1 else -1.0
+                out[row, h % self.dim] += sign * (1.0 + np.log(tf))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+_EMBEDDERS: Dict[str, Callable[[int], object]] = {
+    "hashing": lambda dim: HashingEmbedder(dim=dim),
+}
+
+
+def register_embedder(name: str, factory: Callable[[int], object]) -> None:
+    """Register a local embedder factory; it is called with VECTOR_DIM and must
+    return an object with `name`, `dim` and `embed(texts) -> np.ndarray`."""
+    _EMBEDDERS[name] = factory
+
+
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        factory = _EMBEDDERS.get(settings.VECTOR_EMBEDDER) or _EMBEDDERS["hashing"]
+        _embedder = factory(settings.VECTOR_DIM)
+    return _embedder
+
+
+def thought_text(title: Optional[str], content: Optional[str], tags: Iterable[str] = ()) -> str:
+    return " ".join(p for p in [title or "", content or "", " ".join(tags or [])] if p)
+
+
+class UserIndex:
+    """Append-only on-disk vector store for one user's thoughts.
+
+    Vectors live in `<key>.f32` (raw float32 rows) and ids in `<key>.ids`
+    (one per line, same order). Re-adding an id overwrites its row in place;
+    removed rows are dropped by rewriting the files. In memory the rows sit in a buffer that doubles
+    when full, so appends do not copy the whole matrix.
+    """
+
+    def __init__(self, directory: Path, user_id: str, embedder):
+        key = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:20]
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self.vec_path = directory / f"{key}.f32"
+        self.ids_path = directory / f"{key}.ids"
+        self.meta_path = directory / f"{key}.meta"
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._buf = np.zeros((0, self.dim), dtype=np.float32)
+        self._live_buf = np.zeros(0, dtype=bool)
+        self._n = 0
+        self._pos: Dict[str, int] = {}
+        self._loaded = False
+
+    @property
+    def _vectors(self) -> np.ndarray:
+        return self._buf[: self._n]
+
+    @property
+    def _live(self) -> np.ndarray:
+        return self._live_buf[: self._n]
+
+    def _set_rows(self, vectors: np.ndarray) -> None:
+        self._buf = vectors
+        self._live_buf = np.ones(len(vectors), dtype=bool)
+        self._n = len(vectors)
+
+    def _append_rows(self, vectors: np.ndarray) -> None:
+        n = self._n + len(vectors)
+        if n > self._buf.shape[0]:
+            capacity = max(n, 2 * self._buf.shape[0], 64)
+            buf = np.empty((capacity, self.dim), dtype=np.float32)
+            buf[: self._n] = self._vectors
+            live = np.zeros(capacity, dtype=bool)
+            live[: self._n] = self._live
+            self._buf, self._live_buf = buf, live
+        self._buf[self._n : n] = vectors
+        self._live_buf[self._n : n] = True
+        self._n = n
+
+    @property
+    def exists(self) -> bool:
+        if not self.meta_path.exists():
+            return False
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except Exception:
+            return False
+        return meta.get("dim") == self.dim and meta.get("embedder") == self.embedder.name
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._pos)
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.exists:
+            return
+        try:
+            ids = self.ids_path.read_text(encoding="utf-8").splitlines() if self.ids_path.exists() else []
+            vecs = np.fromfile(self.vec_path, dtype=np.float32) if self.vec_path.exists() else np.zeros(0, np.float32)
+            vecs = vecs[: (vecs.size // self.dim) * self.dim].reshape(-1, self.dim)
+        except Exception:
+            return
+        n = min(len(ids), vecs.shape[0])
+        self._ids = ids[:n]
+        self._set_rows(vecs[:n].copy())
+        for i, tid in enumerate(self._ids):
+            prev = self._pos.get(tid)
+            if prev is not None:
+                self._live[prev] = False
+            self._pos[tid] = i
+        # Rows are overwritten in place by position, so the files must line
+        # up with memory: drop duplicates (older indexes appended them) and
+        # any partly written tail.
+        if len(self._pos) < n or n != len(ids) or n != vecs.shape[0]:
+            self._rewrite()
+
+    def _write_meta(self) -> None:
+        self.meta_path.write_text(json.dumps({"dim": self.dim, "embedder": self.embedder.name}))
+
+    def _rewrite(self) -> None:
+        keep = np.flatnonzero(self._live)
+        self._ids = [self._ids[i] for i in keep]
+        self._set_rows(self._vectors[keep])
+        self._pos = {tid: i for i, tid in enumerate(self._ids)}
+        self._vectors.astype(np.float32).tofile(self.vec_path)
+        self.ids_path.write_text("".join(f"{tid}\n" for tid in self._ids), encoding="utf-8")
+        self._write_meta()
+
+    def add(self, items: Sequence[Tuple[str, str]]) -> None:
+        """Embed `(thought_id, text)` pairs, replacing the vectors of ids
+        already in the index and appending the others."""
+        if not items:
+            return
+        vecs = self.embedder.embed([text for _, text in items]).astype(np.float32)
+        latest = dict(zip((tid for tid, _ in items), vecs))
+        with self._lock:
+            self._load()
+            fresh = not self.exists
+            replaced = [(self._pos[tid], vec) for tid, vec in latest.items() if tid in self._pos]
+            added = [tid for tid in latest if tid not in self._pos]
+            for pos, vec in replaced:
+                self._buf[pos] = vec
+            for tid in added:
+                self._pos[tid] = len(self._ids)
+                self._ids.append(tid)
+            if added:
+                self._append_rows(np.stack([latest[tid] for tid in added]))
+            if fresh:
+                self._rewrite()
+                return
+            if replaced:
+                with open(self.vec_path, "r+b") as f:
+                    for pos, vec in replaced:
+                        f.seek(pos * self.dim * 4)
+                        f.write(vec.tobytes())
+            if added:
+                with open(self.vec_path, "ab") as f:
+                    f.write(self._vectors[-len(added) :].tobytes())
+                with open(self.ids_path, "a", encoding="utf-8") as f:
+                    f.write("".join(f"{tid}\n" for tid in added))
+
+    def rebuild(self, items: Sequence[Tuple[str, str]]) -> None:
+        """Replace the whole index, e.g. when backfilling an existing database."""
+        with self._lock:
+            self._loaded = True
+            self._ids = [tid for tid, _ in items]
+            self._set_rows(
+                self.embedder.embed([text for _, text in items]).astype(np.float32)
+                if items
+                else np.zeros((0, self.dim), dtype=np.float32)
+            )
+            self._pos = {}
+            for i, tid in enumerate(self._ids):
+                prev = self._pos.get(tid)
+                if prev is not None:
+                    self._live[prev] = False
+                self._pos[tid] = i
+            self._rewrite()
+
+    def remove(self, thought_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._load()
+            changed = False
+            for tid in thought_ids:
+                pos = self._pos.pop(tid, None)
+                if pos is not None:
+                    self._live[pos] = False
+                    changed = True
+            if changed:
+                self._rewrite()
+
+    def unload(self) -> None:
+        """Drop the in-memory copy; the next use reads the files again."""
+        with self._lock:
+            self._ids = []
+            self._set_rows(np.zeros((0, self.dim), dtype=np.float32))
+            self._pos = {}
+            self._loaded = False
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Return up to `k` `(thought_id, cosine)` pairs, best first."""
+        qvec = self.embedder.embed([query])[0]
+        with self._lock:
+            self._load()
+            if not self._pos or k <= 0:
+                return []
+            scores = self._vectors @ qvec
+            scores[~self._live] = -np.inf
+            live = len(self._pos)
+            k = min(k, live)
+            if k < live:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.flatnonzero(self._live)
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[i], float(scores[i])) for i in top]
+
+
+# One UserIndex per user for the life of the process, so two instances
+# never write the same files. Only the VECTOR_INDEX_MAX_LOADED most recently
+# used keep their matrix in memory; the others are unloaded and read their
+# files again when next used.
+_indexes: Dict[str, UserIndex] = {}
+_recent: "OrderedDict[str, None]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def index_for(user_id: str) -> UserIndex:
+    with _indexes_lock:
+        idx = _indexes.get(user_id)
+        if idx is None:
+            directory = Path(settings.VECTOR_INDEX_DIR)
+            directory.mkdir(parents=True, exist_ok=True)
+            idx = UserIndex(directory, user_id, get_embedder())
+            _indexes[user_id] = idx
+        _recent[user_id] = None
+        _recent.move_to_end(user_id)
+        evicted = []
+        while len(_recent) > max(1, settings.VECTOR_INDEX_MAX_LOADED):
+            evicted.append(_indexes[_recent.popitem(last=False)[0]])
+    for old in evicted:
+        old.unload()
+    return idx
+
+
+def add_thought(user_id: str, thought_id: str, title: Optional[str], content: str, tags: Iterable[str] = ()) -> None:
+    """Index a freshly written thought. Skipped when the user's index has not
+    been built yet; the first search backfills it from the database."""
+    idx = index_for(user_id)
+    if idx.exists:
+        idx.add([(thought_id, thought_text(title, content, tags))])
+
+
+def add_thoughts(user_id: str, items: Sequence[Tuple[str, str]]) -> None:
+    """Bulk variant of add_thought for `(thought_id, text)` pairs."""
+    idx = index_for(user_id)
+    if idx.exists:
+        idx.add(items)
+
+
+def clear_user(user_id: str) -> None:
+    # Leave an empty (but built) index behind so new thoughts keep being
+    # appended incrementally instead of waiting for a backfill.
+    index_for(user_id).rebuild([])
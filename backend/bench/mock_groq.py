@@ -0,0 +1,176 @@
+"""Local stand-in for the Groq endpoints the backend calls.
+
+Serves chat completions (plain, JSON mode and streamed), transcription and
+speech under /openai/v1 with configurable latency and error injection, so
+the backend can be load tested without a key or rate limits:
+
+    python -m bench.mock_groq --port 8090 --latency-ms 250 --jitter-ms 100 --error-rate 0.01
+    GROQ_BASE_URL=http://127.0.0.1:8090/openai/v1 GROQ_API_KEY=bench uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+app = FastAPI(title="mock-groq")
+
+config = {
+    "latency_ms": 200.0,
+    "jitter_ms": 50.0,
+    "error_rate": 0.0,
+    "error_status": 503,
+    "token_delay_ms": 15.0,
+    "audio_bytes_per_char": 400,
+}
+counters = {"chat": 0, "transcriptions": 0, "speech": 0, "errors": 0}
+
+_WORD_RE = re.compile(r"[a-z]{4,}")
+_COMMENT = (
+    "You have a few notes that touch on this. The most recent one looks like the best place to pick it up again."
+)
+
+
+async def _delay(scale: float = 1.0) -> None:
+    ms = random.gauss(config["latency_ms"], config["jitter_ms"]) * scale
+    if ms > 0:
+        await asyncio.sleep(ms / 1000.0)
+
+
+def _injected_error():
+    if config["error_rate"] and random.random() < config["error_rate"]:
+        counters["errors"] += 1
+        status = int(config["error_status"])
+        headers = {"retry-after": "1"} if status == 429 else {}
+        return JSONResponse({"error": {"message": "injected failure"}}, status_code=status, headers=headers)
+    return None
+
+
+def _completion(content: str, prompt_chars: int) -> dict:
+    return {
+        "id": "mock",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4},
+    }
+
+
+def _metadata_for(text: str) -> dict:
+    words = _WORD_RE.findall(text.lower())
+    tags = list(dict.fromkeys(words))[:3]
+    return {
+        "title": " ".join(text.split()[:6]) or "Untitled",
+        "summary": text[:160],
+        "tags": tags,
+        "entities": [w.capitalize() for w in tags[:1]],
+        "interpretation": f"A note about {', '.join(tags) or 'something'}.",
+    }
+
+
+def _json_reply(messages: list) -> str:
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    if "relevant_indices" in user:
+        start = user.find("Thoughts:\n")
+        try:
+            entries = json.loads(user[start + len("Thoughts:\n") :].split("\n\n", 1)[0])
+        except ValueError:
+            entries = []
+        picked = [e["index"] for e in entries if isinstance(e, dict) and "index" in e][:8]
+        return json.dumps({"relevant_indices": picked})
+    try:
+        batch = json.loads(user)
+    except ValueError:
+        batch = None
+    if isinstance(batch, list):
+        return json.dumps({"items": [{"index": n.get("index"), **_metadata_for(n.get("content") or "")} for n in batch]})
+    return json.dumps(_metadata_for(user))
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat(request: Request):
+    counters["chat"] += 1
+    body = await request.json()
+    messages = body.get("messages") or []
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    if body.get("stream"):
+        await _delay(0.5)
+        error = _injected_error()
+        if error is not None:
+            return error
+
+        async def events():
+            for word in _COMMENT.split(" "):
+                chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(config["token_delay_ms"] / 1000.0)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+    # Larger prompts take longer, roughly like the real service.
+    await _delay(1.0 + prompt_chars / 20000.0)
+    error = _injected_error()
+    if error is not None:
+        return error
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return _completion(_json_reply(messages), prompt_chars)
+    return _completion(_COMMENT, prompt_chars)
+
+
+@app.post("/openai/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    counters["transcriptions"] += 1
+    form = await request.form()
+    upload = form.get("file")
+    size = len(await upload.read()) if upload is not None else 0
+    await _delay(1.0 + size / 1_000_000)
+    error = _injected_error()
+    if error is not None:
+        return error
+    return {"text": f"Mock transcript of {size} bytes of audio."}
+
+
+@app.post("/openai/v1/audio/speech")
+async def speech(request: Request):
+    counters["speech"] += 1
+    body = await request.json()
+    text = body.get("input") or ""
+    await _delay()
+    error = _injected_error()
+    if error is not None:
+        return error
+    return Response(b"\xff\xfb" * (len(text) * config["audio_bytes_per_char"] // 2), media_type="audio/mpeg")
+
+
+@app.get("/stats")
+async def stats():
+    return {"config": config, "counters": counters}
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=config["latency_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=config["jitter_ms"])
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="fraction of calls that fail")
+    parser.add_argument("--error-status", type=int, default=config["error_status"], help="e.g. 429, 500, 503")
+    parser.add_argument("--token-delay-ms", type=float, default=config["token_delay_ms"])
+    args = parser.parse_args()
+    config.update(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        token_delay_ms=args.token_delay_ms,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
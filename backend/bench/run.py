@@ -0,0 +1,227 @@
+"""Closed-loop load driver for the backend's hot endpoints.
+
+Each scenario runs --concurrency workers for --duration seconds against a
+running server and reports throughput, error rate and p50/p95/p99 latency.
+Results can be stored as a named baseline (bench/baselines/<name>.json,
+created by --save-baseline; none ship with the repo, since latencies depend
+on the machine) and later runs compared against it; the exit status is 1
+when a scenario regresses beyond --tolerance.
+
+    python -m bench.run --users 2 --duration 20 --save-baseline main
+    python -m bench.run --users 2 --duration 20 --compare main
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench.seed import TOPICS
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+SCENARIOS = ["thoughts", "ingest", "search", "assist-search-full", "assist-comment", "tts"]
+
+
+def percentile(sorted_ms: List[float], p: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, int(round(p / 100.0 * len(sorted_ms) + 0.5)) - 1))
+    return sorted_ms[k]
+
+
+def make_queries(n: int, rng: random.Random) -> List[str]:
+    words = [w for ws in TOPICS.values() for w in ws] + list(TOPICS)
+    return [" ".join(rng.sample(words, rng.randint(1, 3))) for _ in range(n)]
+
+
+class Scenario:
+    def __init__(self, name: str, users: List[str], queries: List[str]):
+        self.name = name
+        self.users = users
+        self.queries = queries
+        self.cursors: Dict[str, Optional[str]] = {}
+
+    async def call(self, client: httpx.AsyncClient, rng: random.Random) -> httpx.Response:
+        user = rng.choice(self.users)
+        headers = {"X-User-Id": user}
+        q = rng.choice(self.queries)
+        if self.name == "thoughts":
+            # Walk the user's list with keyset cursors, restarting at the end.
+            params = {"limit": 20}
+            if self.cursors.get(user):
+                params["cursor"] = self.cursors[user]
+            resp = await client.get("/v1/thoughts", params=params, headers=headers)
+            self.cursors[user] = resp.headers.get("X-Next-Cursor")
+            return resp
+        if self.name == "ingest":
+            body = {"content": f"Benchmark note {rng.getrandbits(32)} about {q}.", "source": "bench"}
+            return await client.post("/v1/thoughts", json=body, headers=headers)
+        if self.name == "search":
+            return await client.post("/v1/search", json={"query": q, "topK": 10}, headers=headers)
+        if self.name == "assist-search-full":
+            return await client.post("/v1/assist-search-full", json={"query": q, "topK": 5}, headers=headers)
+        if self.name == "assist-comment":
+            return await client.post("/v1/assist-comment", json={"query": q, "topK": 5}, headers=headers)
+        if self.name == "tts":
+            text = f"Here is what I found about {q}."
+            return await client.post("/v1/tts", json={"text": text, "voice": "alloy", "format": "mp3"}, headers=headers)
+        raise ValueError(f"unknown scenario {self.name}")
+
+
+async def run_scenario(
+    base_url: str,
+    api_key: str,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int,
+) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    statuses: Dict[int, int] = {}
+    headers = {"X-API-Key": api_key} if api_key else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=120.0) as client:
+        started = time.perf_counter()
+        measure_from = started + warmup
+        deadline = measure_from + duration
+
+        async def worker(n: int) -> None:
+            nonlocal errors
+            rng = random.Random(seed * 1000 + n)
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                try:
+                    resp = await scenario.call(client, rng)
+                    await resp.aread()
+                    status = resp.status_code
+                except httpx.HTTPError:
+                    status = 0
+                t1 = time.perf_counter()
+                if t0 < measure_from:
+                    continue
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 0 or status >= 400:
+                    errors += 1
+                else:
+                    latencies.append((t1 - t0) * 1000.0)
+
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    latencies.sort()
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "throughput": round(len(latencies) / duration, 2),
+        "errorRate": round(errors / total, 4) if total else 0.0,
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Regressions of p95/p99 latency, throughput or error rate beyond `tolerance`."""
+    problems = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("p95", "p99"):
+            if base[key] and cur[key] > base[key] * (1 + tolerance):
+                problems.append(f"{name}: {key} {cur[key]:.1f}ms vs baseline {base[key]:.1f}ms")
+        if base["throughput"] and cur["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(f"{name}: throughput {cur['throughput']:.1f}/s vs baseline {base['throughput']:.1f}/s")
+        if cur["errorRate"] > base["errorRate"] + 0.01:
+            problems.append(f"{name}: error rate {cur['errorRate']:.2%} vs baseline {base['errorRate']:.2%}")
+    return problems
+
+
+def print_table(results: Dict[str, dict], baseline: Optional[Dict[str, dict]]) -> None:
+    def delta(name: str, key: str) -> str:
+        base = (baseline or {}).get(name, {}).get(key)
+        if not base:
+            return ""
+        return f" ({(results[name][key] - base) / base:+.0%})"
+
+    print(f"{'scenario':<20} {'req/s':>14} {'err':>7} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16}")
+    for name, r in results.items():
+        print(
+            f"{name:<20} {str(r['throughput']) + delta(name, 'throughput'):>14} {r['errorRate']:>7.2%} "
+            f"{str(r['p50']) + delta(name, 'p50'):>16} {str(r['p95']) + delta(name, 'p95'):>16} "
+            f"{str(r['p99']) + delta(name, 'p99'):>16}"
+        )
+
+
+async def run(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    users = [f"{args.prefix}-{u}" for u in range(args.users)]
+    queries = make_queries(args.query_pool, rng)
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"unknown scenarios: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    baseline = None
+    if args.compare:
+        path = BASELINE_DIR / f"{args.compare}.json"
+        if not path.exists():
+            print(f"no baseline {path}; record one first with --save-baseline {args.compare}", file=sys.stderr)
+            return 2
+        baseline = json.loads(path.read_text())["results"]
+    results = {}
+    for name in names:
+        results[name] = await run_scenario(
+            args.base_url,
+            args.api_key,
+            Scenario(name, users, queries),
+            args.concurrency,
+            args.duration,
+            args.warmup,
+            args.seed,
+        )
+    print_table(results, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps({"results": results}, indent=2))
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        meta = {k: getattr(args, k) for k in ("users", "concurrency", "duration", "query_pool", "seed")}
+        (BASELINE_DIR / f"{args.save_baseline}.json").write_text(
+            json.dumps({"params": meta, "results": results}, indent=2) + "\n"
+        )
+    if baseline is not None:
+        problems = compare(results, baseline, args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        return 1 if problems else 0
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", default="")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--users", type=int, default=1, help="bench users seeded by bench.seed")
+    parser.add_argument("--prefix", default="bench")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each scenario")
+    parser.add_argument("--query-pool", type=int, default=200, help="distinct queries; smaller means more cache hits")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME", help="baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
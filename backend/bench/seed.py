@@ -0,0 +1,101 @@
+"""Seed benchmark users with synthetic, already-enriched thoughts.
+
+Writes straight to DATABASE_URL (the FTS and tag tables are filled by their
+triggers), rebuilds each user's vector index and bumps their query-cache
+version, deterministically for a given --seed. Run it with the server's
+environment so the bump reaches the shared sqlite cache; a server on the
+per-process memory cache must be restarted instead:
+
+    python -m bench.seed --users 2 --thoughts 10000
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.db import EnrichmentJob, Thought, engine
+from app.migrations import init_db
+from app.services import query_cache, vector_index
+
+TOPICS = {
+    "startup": ["pitch", "investors", "runway", "fundraise", "cofounder", "launch", "pricing"],
+    "fishing": ["lake", "trout", "bait", "boat", "morning", "river", "catch"],
+    "fitness": ["run", "workout", "gym", "stretch", "marathon", "pace", "recovery"],
+    "hiring": ["engineer", "interview", "offer", "candidate", "recruiter", "onboarding", "salary"],
+    "audio": ["microphone", "recording", "podcast", "noise", "headphones", "mixer", "studio"],
+    "cooking": ["recipe", "basil", "dinner", "oven", "pasta", "market", "spices"],
+    "travel": ["flight", "hotel", "itinerary", "passport", "beach", "train", "museum"],
+    "reading": ["novel", "chapter", "author", "library", "essay", "notes", "quotes"],
+}
+PEOPLE = ["Sarah", "Miguel", "Priya", "Tom", "Aiko", "Lena", "Omar", "Grace"]
+OPENERS = ["Idea:", "Reminder:", "Meeting notes:", "Thought:", "Todo:", "Research:", "Journal:"]
+FILLER = ["about", "with", "before", "after", "during", "for", "maybe", "really", "next", "week", "today"]
+
+
+def make_thought(rng: random.Random, user_id: str, created_at: datetime) -> dict:
+    topic = rng.choice(list(TOPICS))
+    words = TOPICS[topic]
+    person = rng.choice(PEOPLE)
+    body = [rng.choice(OPENERS)]
+    for _ in range(rng.randint(8, 60)):
+        body.append(rng.choice(words) if rng.random() < 0.45 else rng.choice(FILLER))
+    if rng.random() < 0.4:
+        body.append(f"with {person}")
+    content = " ".join(body) + "."
+    tags = [topic] + rng.sample(words, 2)
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "user_id": user_id,
+        "source": rng.choice(["manual", "voice", "import"]),
+        "title": f"{topic.capitalize()} {rng.choice(words)}",
+        "summary": content[:160],
+        "content": content,
+        "tags_json": json.dumps(tags),
+        "entities_json": json.dumps([person] if f"with {person}" in content else []),
+        "interpretation": f"A {topic} note.",
+        "enrichment_status": "done",
+        "created_at": created_at,
+    }
+
+
+def seed(users: int, thoughts: int, seed_value: int = 42, prefix: str = "bench", batch: int = 5000) -> None:
+    init_db()
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    for u in range(users):
+        user_id = f"{prefix}-{u}"
+        with engine.begin() as conn:
+            conn.execute(EnrichmentJob.__table__.delete().where(EnrichmentJob.user_id == user_id))
+            conn.execute(Thought.__table__.delete().where(Thought.user_id == user_id))
+        started = time.perf_counter()
+        indexed = []
+        for start in range(0, thoughts, batch):
+            rows = [
+                make_thought(rng, user_id, now - timedelta(minutes=thoughts - i))
+                for i in range(start, min(thoughts, start + batch))
+            ]
+            with engine.begin() as conn:
+                conn.execute(Thought.__table__.insert(), rows)
+            indexed.extend(
+                (r["id"], vector_index.thought_text(r["title"], r["content"], json.loads(r["tags_json"]))) for r in rows
+            )
+        vector_index.index_for(user_id).rebuild(indexed)
+        query_cache.backend().bump(user_id)
+        print(f"{user_id}: {thoughts} thoughts in {time.perf_counter() - started:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--thoughts", type=int, default=1000, help="per user (1k-100k)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="bench", help="user ids are <prefix>-<n>")
+    args = parser.parse_args()
+    seed(args.users, args.thoughts, args.seed, args.prefix)
+
+
+if __name__ == "__main__":
+    main()